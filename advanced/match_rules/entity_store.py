@@ -0,0 +1,229 @@
+import hashlib
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+METADATA = "metadata"
+
+
+def flat_items(entity: Dict) -> Iterator[Tuple[str, object]]:
+    for k, v in entity.items():
+        if not isinstance(v, (dict, list)):
+            yield k, v
+    for k, v in (entity.get(METADATA) or {}).items():
+        yield METADATA + "." + k, v
+
+
+def flatten(entity: Dict) -> Dict:
+    return dict(flat_items(entity))
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def int_array(values: List) -> Optional[np.ndarray]:
+    # The values as an int64 array, or None if they are not all Python ints that fit
+    if not all(type(v) is int for v in values):
+        return None
+    try:
+        return np.array(values, dtype=np.int64)
+    except OverflowError:
+        return None
+
+
+class IdIndex:
+    # Maps ids to rows. Integer ids, which all CDF ids are, are kept in a sorted NumPy
+    # array, which takes a fraction of the memory of a dict with millions of entries.
+    def __init__(self, ids: List):
+        self._by_id = None
+        array = int_array(ids) if ids else None
+        if array is not None:
+            self._order = np.argsort(array, kind="stable")
+            self._sorted = array[self._order]
+            return
+        self._by_id = {id: row for row, id in enumerate(ids)}
+
+    def row(self, id) -> Optional[int]:
+        if self._by_id is not None:
+            return self._by_id.get(id)
+        if not isinstance(id, (int, np.integer)) or isinstance(id, bool):
+            return None
+        i = np.searchsorted(self._sorted, id)
+        if i < len(self._sorted) and self._sorted[i] == id:
+            return int(self._order[i])
+        return None
+
+    def rows(self, ids: Iterable) -> np.ndarray:
+        # The rows of many ids at once, with -1 for unknown ids. An integer array of ids
+        # is looked up in the sorted ids without converting its values to Python ints.
+        if isinstance(ids, np.ndarray):
+            if ids.dtype.kind == "i" and self._by_id is None:
+                array, known = ids.astype(np.int64), np.ones(len(ids), dtype=bool)
+            else:
+                ids = ids.tolist()
+        if not isinstance(ids, np.ndarray):
+            ids = list(ids)
+            if self._by_id is not None:
+                return np.array([self._by_id.get(id, -1) for id in ids], dtype=np.int64)
+            known = np.array([type(id) is int for id in ids], dtype=bool)
+            array = np.array(
+                [id if k else 0 for id, k in zip(ids, known)], dtype=np.int64
+            )
+        i = np.searchsorted(self._sorted, array).clip(0, len(self._sorted) - 1)
+        return np.where(known & (self._sorted[i] == array), self._order[i], -1)
+
+
+class EntityStore:
+    # Entities as one list per flattened field instead of one dict per entity. A column
+    # is only extracted from the entities when it is first asked for, so fields that are
+    # never selected are never flattened, and string values are interned, so repeated
+    # metadata values are kept once. Columns and records are views on the store, and
+    # must not be modified.
+    def __init__(self, entities: Iterable[Dict] = (), id_field: str = "id"):
+        self._entities = entities if isinstance(entities, list) else list(entities)
+        self.id_field = id_field
+        self.columns = {}
+        self.size = len(self._entities)
+        self._fields = None
+        self._index = None
+        self._fingerprints = {}
+        self._loaders = {}
+
+    @classmethod
+    def from_columns(
+        cls,
+        loaders: Dict[str, Callable[[], List]],
+        size: int,
+        id_field: str = "id",
+    ) -> "EntityStore":
+        # A store of saved columns, each loaded when it is first asked for. The entities
+        # are only rebuilt from the columns if something needs them as dicts.
+        store = cls([], id_field)
+        store._entities = None
+        store.size = size
+        store._fields = list(loaders)
+        store._loaders = dict(loaders)
+        return store
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, id):
+        return self.row(id) is not None
+
+    @property
+    def fields(self) -> List[str]:
+        # One pass over the entities, without building the flattened entities
+        if self._fields is None:
+            fields, metadata = set(), set()
+            for entity in self.entities:
+                for k, v in entity.items():
+                    if not isinstance(v, (dict, list)):
+                        fields.add(k)
+                metadata.update(entity.get(METADATA) or ())
+            self._fields = sorted(fields) + sorted(METADATA + "." + k for k in metadata)
+        return self._fields
+
+    @property
+    def entities(self) -> List[Dict]:
+        if self._entities is None:
+            self._entities = self._build_entities()
+        return self._entities
+
+    def _build_entities(self) -> List[Dict]:
+        prefix = METADATA + "."
+        fields = [f for f in self.fields if not f.startswith(prefix)]
+        keys = [f[len(prefix) :] for f in self.fields if f.startswith(prefix)]
+        columns = [self.column(f) for f in fields]
+        metadata_columns = [self.column(prefix + k) for k in keys]
+        entities = []
+        for row in range(self.size):
+            entity = {f: c[row] for f, c in zip(fields, columns) if c[row] is not None}
+            metadata = {
+                k: c[row] for k, c in zip(keys, metadata_columns) if c[row] is not None
+            }
+            if metadata:
+                entity[METADATA] = metadata
+            entities.append(entity)
+        return entities
+
+    @property
+    def ids(self) -> List:
+        return self.column(self.id_field)
+
+    @property
+    def index(self) -> IdIndex:
+        if self._index is None:
+            self._index = IdIndex(self.ids)
+        return self._index
+
+    def column(self, field: str) -> List:
+        if field not in self.columns:
+            if field in self._loaders:
+                self.columns[field] = self._loaders.pop(field)()
+            elif self._entities is None:
+                # A field the saved entities do not have
+                self.columns[field] = [None] * self.size
+            else:
+                self.columns[field] = self._extract(field, self.entities)
+        return self.columns[field]
+
+    @staticmethod
+    def _extract(field: str, entities: List[Dict]) -> List:
+        if field.startswith(METADATA + "."):
+            key = field[len(METADATA) + 1 :]
+            return [_intern((e.get(METADATA) or {}).get(key)) for e in entities]
+        return [
+            None if isinstance(v, (dict, list)) else _intern(v)
+            for v in (e.get(field) for e in entities)
+        ]
+
+    def extend(self, entities: Iterable[Dict]):
+        # Appends entities, for instance pages as they are fetched. The columns that are
+        # already extracted are extended with the new entities only.
+        entities = list(entities)
+        self.entities.extend(entities)
+        self.size += len(entities)
+        for field, column in self.columns.items():
+            column.extend(self._extract(field, entities))
+        self._fields = None
+        self._index = None
+        self._fingerprints = {}
+
+    def row(self, id) -> Optional[int]:
+        return self.index.row(id)
+
+    def _row(self, id) -> int:
+        row = self.row(id)
+        if row is None:
+            raise KeyError(id)
+        return row
+
+    def get(self, id, field: str, default=None):
+        value = self.column(field)[self._row(id)]
+        return default if value is None else value
+
+    def record(self, id, fields: Optional[List[str]] = None) -> Dict:
+        row = self._row(id)
+        if fields is None:
+            return flatten(self.entities[row])
+        return {f: self.column(f)[row] for f in fields}
+
+    def fingerprint(self, fields: List[str]) -> str:
+        # A hash of the ids and the values of the fields, which identifies the entities
+        # as they are sent to the API
+        key = tuple(sorted({self.id_field} | set(fields)))
+        if key not in self._fingerprints:
+            h = hashlib.sha256()
+            for field in key:
+                h.update(repr((field, self.column(field))).encode())
+            self._fingerprints[key] = h.hexdigest()
+        return self._fingerprints[key]
+
+    def project(self, fields: List[str]) -> List[Dict]:
+        if not fields:
+            return [{} for _ in range(self.size)]
+        columns = [self.column(f) for f in fields]
+        return [dict(zip(fields, values)) for values in zip(*columns)]
@@ -0,0 +1,86 @@
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from entity_store import int_array
+
+
+def _id_array(ids: List) -> np.ndarray:
+    array = int_array(ids)
+    if array is not None:
+        return array
+    array = np.empty(len(ids), dtype=object)
+    array[:] = ids
+    return array
+
+
+def _pairs(
+    sources: np.ndarray, targets: np.ndarray, limit: Optional[int], offset: int = 0
+):
+    end = None if limit is None else offset + limit
+    return list(zip(sources[offset:end].tolist(), targets[offset:end].tolist()))
+
+
+class MatchArrays:
+    # The unambiguous matches of a list as two aligned arrays sorted by source. Each
+    # source has one target, so the sources are unique.
+    def __init__(self, matches: Iterable[Tuple]):
+        pairs = list(matches)
+        sources = _id_array([source for source, _ in pairs])
+        targets = _id_array([target for _, target in pairs])
+        order = np.argsort(sources, kind="stable")
+        self.sources = sources[order]
+        self.targets = targets[order]
+
+    def __len__(self):
+        return len(self.sources)
+
+
+class Comparison:
+    # Splits two lists of unambiguous matches into the matches they agree on, the
+    # sources they match to different targets, and the matches of sources that only one
+    # of them has, with one sorted join of the sources
+    def __init__(self, first: MatchArrays, second: MatchArrays):
+        common, i, j = np.intersect1d(
+            first.sources, second.sources, assume_unique=True, return_indices=True
+        )
+        same = first.targets[i] == second.targets[j]
+        self.agreed_sources = common[same]
+        self.agreed_targets = first.targets[i[same]]
+        self.disagreed_sources = common[~same]
+
+        first_only = np.ones(len(first), dtype=bool)
+        first_only[i] = False
+        self.first_only_sources = first.sources[first_only]
+        self.first_only_targets = first.targets[first_only]
+
+        second_only = np.ones(len(second), dtype=bool)
+        second_only[j] = False
+        self.second_only_sources = second.sources[second_only]
+        self.second_only_targets = second.targets[second_only]
+
+    def agreed(self, limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+        return _pairs(self.agreed_sources, self.agreed_targets, limit, offset)
+
+    def disagreed(self, limit: Optional[int] = None, offset: int = 0) -> List:
+        end = None if limit is None else offset + limit
+        return self.disagreed_sources[offset:end].tolist()
+
+    def first_only(self, limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+        return _pairs(self.first_only_sources, self.first_only_targets, limit, offset)
+
+    def second_only(self, limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+        return _pairs(self.second_only_sources, self.second_only_targets, limit, offset)
+
+
+def agreement_matrix(lists: List[MatchArrays]) -> np.ndarray:
+    # The number of matches each pair of lists agrees on, with the size of each list on
+    # the diagonal
+    matrix = np.zeros((len(lists), len(lists)), dtype=np.int64)
+    for a, first in enumerate(lists):
+        matrix[a, a] = len(first)
+        for b in range(a + 1, len(lists)):
+            matrix[a, b] = matrix[b, a] = len(
+                Comparison(first, lists[b]).agreed_sources
+            )
+    return matrix
@@ -0,0 +1,73 @@
+from typing import Iterable, Iterator, Optional, Tuple
+
+
+class MatchList:
+    # An ordered set of (source id, target id) matches. The sources with one target
+    # and the sources with several targets are kept up to date on every add and remove,
+    # so `unambiguous` and `ambiguous` are live views that never need recalculating.
+    def __init__(self, matches: Iterable[Tuple] = ()):
+        self._matches = {}
+        self._targets_by_source = {}
+        self._unambiguous = {}
+        self._ambiguous = {}
+        # Incremented on every change, so derived data can tell when it is outdated
+        self.version = 0
+        self.extend(matches)
+
+    def __len__(self):
+        return len(self._matches)
+
+    def __iter__(self) -> Iterator[Tuple]:
+        return iter(self._matches)
+
+    def __contains__(self, match: Tuple):
+        return match in self._matches
+
+    @property
+    def unambiguous(self):
+        # (source, target) for the sources with exactly one target
+        return self._unambiguous.items()
+
+    @property
+    def ambiguous(self):
+        # The sources with more than one target
+        return self._ambiguous.keys()
+
+    def target(self, source) -> Optional:
+        # The target of a source with exactly one target
+        return self._unambiguous.get(source)
+
+    def add(self, match: Tuple) -> bool:
+        if match in self._matches:
+            return False
+        self.version += 1
+        self._matches[match] = None
+        source, target = match
+        targets = self._targets_by_source.setdefault(source, {})
+        targets[target] = None
+        if len(targets) == 1:
+            self._unambiguous[source] = target
+        elif len(targets) == 2:
+            del self._unambiguous[source]
+            self._ambiguous[source] = None
+        return True
+
+    def remove(self, match: Tuple) -> bool:
+        if match not in self._matches:
+            return False
+        self.version += 1
+        del self._matches[match]
+        source, target = match
+        targets = self._targets_by_source[source]
+        del targets[target]
+        if not targets:
+            del self._targets_by_source[source]
+            del self._unambiguous[source]
+        elif len(targets) == 1:
+            del self._ambiguous[source]
+            self._unambiguous[source] = next(iter(targets))
+        return True
+
+    def extend(self, matches: Iterable[Tuple]):
+        for match in matches:
+            self.add(match)
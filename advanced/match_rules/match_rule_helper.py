@@ -1,14 +1,28 @@
+import ast
 import copy
 import json
+import os
+from bisect import bisect_right
+from collections import OrderedDict
 from getpass import getpass
-from typing import Dict, List, Optional, Tuple
+from itertools import accumulate, islice
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 import ipywidgets as widgets
 from cognite.experimental import CogniteClient
 from IPython.display import display
+import numpy as np
 from msal import PublicClientApplication
 from regex import regex
 
+from entity_store import EntityStore, flatten
+from match_compare import Comparison, MatchArrays, agreement_matrix
+from match_list import MatchList
+from refresh import RefreshScheduler
+from resource_loader import ASSETS, TIME_SERIES, ResourceLoader
+from rule_engine import apply_rules, is_supported, rule_key, rule_relations
+from session import MANIFEST, load_session, save_session
+
 ID = "id"
 DEFAULT = "default"
 MATCHES = "Matches"
@@ -27,41 +41,129 @@ APPLY_CHANGES = "Apply changes"
 
 RULE_OUTPUT = "rule_output"
 
+# The views refreshed through the RefreshScheduler
+USER_MATCHES = "user_matches"
+RULE_MATCHES = "rule_matches"
+COMPARE_OPTIONS = "compare_options"
+COMPARISON = "comparison"
+
+NO_VALUE = "No value"
+SEPARATOR = "\x00"
+
+
+class RootAssetSelector:
+    # Root assets are fetched a page at a time when the selector is shown or the user
+    # asks for more, and searched by name in CDF. The number of assets and time series
+    # under a root is fetched when it is first selected.
+    def __init__(self, loader: ResourceLoader, limit: int = 100):
+        self.loader = loader
+        self.limit = limit
+        self.roots = []
+        self.cursor = None
+        self.fetched = False
+        self.counts_by_root = {}
+
+        self.search_text = widgets.Text(
+            description="Search roots", continuous_update=False
+        )
+        self.search_text.observe(self._search, names="value")
+        self.root_dropdown = widgets.Dropdown(
+            options=[], value=None, description="Select root asset"
+        )
+        self.root_dropdown.observe(self._show_counts, names="value")
+        self.more_button = widgets.Button(description="More roots", disabled=True)
+        self.more_button.on_click(self._fetch_more)
+        self.count_label = widgets.Label()
+        self.widget = widgets.VBox(
+            [
+                widgets.HBox([self.search_text, self.more_button]),
+                widgets.HBox([self.root_dropdown, self.count_label]),
+            ]
+        )
+
+    def display(self):
+        if not self.fetched:
+            self._fetch_more()
+        display(self.widget)
+
+    def _fetch_more(self, _=None):
+        roots, self.cursor = self.loader.roots(
+            self.search_text.value, self.cursor, self.limit
+        )
+        self.fetched = True
+        self.roots.extend(r for r in roots if "asset" not in r.get("name", ""))
+        self.root_dropdown.options = [(r.get("name"), r["id"]) for r in self.roots]
+        # Select the first root, so there is one to load from without choosing
+        if self.root_dropdown.value is None and self.roots:
+            self.root_dropdown.value = self.roots[0]["id"]
+        self.more_button.disabled = self.cursor is None
+
+    def _search(self, _):
+        self.roots, self.cursor = [], None
+        self._fetch_more()
+
+    def _show_counts(self, change):
+        root_id = change["new"]
+        if root_id is None:
+            self.count_label.value = ""
+            return
+        assets = self.count(ASSETS, root_id)
+        time_series = self.count(TIME_SERIES, root_id)
+        self.count_label.value = f"{assets} assets, {time_series} time series"
+
+    def count(self, resource_type: str, root_id: int, refresh=False) -> int:
+        counts = self.counts_by_root.setdefault(root_id, {})
+        if refresh or resource_type not in counts:
+            counts[resource_type] = self.loader.count(resource_type, root_id)
+        return counts[resource_type]
+
 
 class ResourceHelper:
-    def __init__(self, client: CogniteClient):
+    def __init__(
+        self,
+        client: CogniteClient,
+        partitions: int = 5,
+        cache_dir: Optional[str] = None,
+    ):
         self.client = client
+        self.loader = ResourceLoader(client, partitions, cache_dir)
+        # Nothing is fetched until the selector is shown
+        self.root_selector = RootAssetSelector(self.loader)
+        self.root_asset_selector = self.root_selector.root_dropdown
 
-        self.root_assets = [
-            a
-            for a in self.client.assets.list(root=True, limit=-1)
-            if "asset" not in a.name
-        ][:100]
-        self.root_asset_selector = widgets.Dropdown(
-            options=[(a.name, a.id) for a in self.root_assets],
-            description="Select root asset",
-        )
+    @property
+    def root_assets(self) -> List[Dict]:
+        return self.root_selector.roots
 
     def select_root_asset(self):
-        display(self.root_asset_selector)
+        self.root_selector.display()
 
-    def get_timeseries(self, limit=-1):
-        root_id = self.root_asset_selector.value
-        return [
-            t.dump()
-            for t in self.client.time_series.list(
-                limit=limit, root_asset_ids=[root_id], partitions=5
-            )
-        ]
+    def get_timeseries(self, limit=-1, on_page=lambda page: None) -> List[Dict]:
+        return self._load(TIME_SERIES, "Time series", limit, on_page)
 
-    def get_assets(self, limit=-1):
+    def get_assets(self, limit=-1, on_page=lambda page: None) -> List[Dict]:
+        return self._load(ASSETS, "Assets", limit, on_page)
+
+    def _load(self, resource_type: str, description: str, limit: int, on_page):
         root_id = self.root_asset_selector.value
-        return [
-            a.dump()
-            for a in self.client.assets.list(
-                limit=limit, root_ids=[root_id], partitions=5
+        if root_id is None:
+            raise ValueError(
+                "No root asset is selected, select one with select_root_asset() first"
             )
-        ]
+        count = self.root_selector.count(resource_type, root_id, refresh=True)
+        total = count if limit == -1 else min(count, limit)
+        progress = widgets.IntProgress(
+            value=0, min=0, max=max(total, 1), description=description
+        )
+        label = widgets.Label(value=f"0 / {total}")
+        display(widgets.HBox([progress, label]))
+
+        def update(page):
+            progress.value = min(progress.value + len(page), progress.max)
+            label.value = f"{progress.value} / {total}"
+            on_page(page)
+
+        return self.loader.load(resource_type, root_id, limit, update, count)
 
 
 def authenticate_azure(base_url: str, tenant_id: str, client_id: str):
@@ -83,10 +185,23 @@ class MatchRuleHelper:
         tenant_id: Optional[str] = None,
         client_id: Optional[str] = None,
         use_api_key=False,
+        apply_locally=False,
+        processes=1,
+        offline=False,
+        partitions=5,
+        cache_dir: Optional[str] = None,
     ):
         self.project = project
-
-        if use_api_key:
+        self.apply_locally = apply_locally
+        self.processes = processes
+        self.partitions = partitions
+        self.cache_dir = cache_dir
+
+        # Offline, for instance to look at a saved session, nothing is fetched from CDF
+        # and only rules that are cached or supported locally can be applied
+        if offline:
+            self.client = None
+        elif use_api_key:
             self.client = CogniteClient(
                 project=project,
                 api_key=getpass(f"Please enter {project} API-KEY: "),
@@ -103,119 +218,152 @@ class MatchRuleHelper:
                 token=credentials["access_token"],
                 token_url=credentials["id_token_claims"]["iss"],
             )
-        self.resource_helper = ResourceHelper(self.client)
+        self.resource_helper = (
+            ResourceHelper(self.client, partitions, cache_dir) if self.client else None
+        )
 
-        self.sources = []
-        self.source_entities = []
-        self.source_by_id = {}
-        self.source_all_fields = []
-        self.source_fields = []
         self.source_id = ID
-        self.reduced_sources = []
+        self.source_store = EntityStore([], self.source_id)
+        self.source_fields = []
+        self._reduced_sources = None
 
-        self.targets = []
-        self.target_entities = []
-        self.target_by_id = {}
-        self.target_all_fields = []
-        self.target_fields = []
         self.target_id = ID
-        self.reduced_targets = []
+        self.target_store = EntityStore([], self.target_id)
+        self.target_fields = []
+        self._reduced_targets = None
+
+        self.refresh = RefreshScheduler()
 
-        self.user_match_lists = {DEFAULT: []}
-        self.user_unambiguous = {DEFAULT: []}
-        self.user_ambiguous = {DEFAULT: []}
+        self.user_match_lists = {DEFAULT: MatchList()}
+        self.user_unambiguous = {DEFAULT: self.user_match_lists[DEFAULT].unambiguous}
+        self.user_ambiguous = {DEFAULT: self.user_match_lists[DEFAULT].ambiguous}
         self.user_match_editor = UserMatchEditor(self)
 
         self.rule_editor = RuleEditor(self)
 
         self.comparator = MatchComparator(self)
 
+        # The views are refreshed once they are displayed
+        self.refresh.register(
+            USER_MATCHES, self.user_match_editor.set_match_options, visible=False
+        )
+        self.refresh.register(
+            RULE_MATCHES,
+            lambda: self.rule_editor._update_rule_info_widget(None),
+            visible=False,
+        )
+        self.refresh.register(
+            COMPARE_OPTIONS, self.comparator.set_compare_options, visible=False
+        )
+        self.refresh.register(COMPARISON, self.comparator._combine_lists, visible=False)
+
+    def batch(self):
+        # Changes made in the block refresh each view once, at the end of the block
+        return self.refresh.batch()
+
     def set_helper_resources(self, limit=-1):
-        self.set_sources(self.resource_helper.get_timeseries(limit))
-        self.set_targets(self.resource_helper.get_assets(limit))
+        # The pages are added to the stores as they arrive, instead of building a list
+        # of SDK objects and dumping them afterwards
+        source_store = EntityStore([], self.source_id)
+        self.resource_helper.get_timeseries(limit, on_page=source_store.extend)
+        target_store = EntityStore([], self.target_id)
+        self.resource_helper.get_assets(limit, on_page=target_store.extend)
+        with self.batch():
+            self.set_source_store(source_store)
+            self.set_target_store(target_store)
 
     def add_cdf_matches(self):
         self.add_match_set(
             "cdf_matches",
             [
-                (k, v.get("asset_id"))
-                for k, v in self.source_by_id.items()
-                if v.get("asset_id") in self.target_by_id
+                (source_id, asset_id)
+                for source_id, asset_id in zip(
+                    self.source_store.ids, self.source_store.column("asset_id")
+                )
+                if asset_id is not None and asset_id in self.target_store
             ],
         )
 
+    @property
+    def source_all_fields(self) -> List[str]:
+        return self.source_store.fields
+
+    @property
+    def target_all_fields(self) -> List[str]:
+        return self.target_store.fields
+
+    @property
+    def sources(self) -> List[Dict]:
+        return self.source_store.entities
+
+    @property
+    def targets(self) -> List[Dict]:
+        return self.target_store.entities
+
+    @property
+    def reduced_sources(self) -> List[Dict]:
+        if self._reduced_sources is None:
+            self._reduced_sources = self.source_store.project(self.source_fields)
+        return self._reduced_sources
+
+    @property
+    def reduced_targets(self) -> List[Dict]:
+        if self._reduced_targets is None:
+            self._reduced_targets = self.target_store.project(self.target_fields)
+        return self._reduced_targets
+
     def set_targets(self, targets):
-        self.targets = targets
-        self.target_entities = [
-            MatchRuleHelper.flatten(target) for target in self.targets
-        ]
-        self.target_all_fields = list(
-            {k for k in entity} for entity in self.target_entities
-        )
-        self.target_by_id = {t[self.target_id]: t for t in self.target_entities}
-        self.reduced_targets = MatchRuleHelper.reduced_entities(
-            self.target_entities, self.target_fields
-        )
-        self.user_match_editor.set_target_entities(self.target_entities)
+        self.set_target_store(EntityStore(targets, self.target_id))
+
+    def set_target_store(self, target_store: EntityStore):
+        self.target_store = target_store
+        self._reduced_targets = None
+        self.user_match_editor.set_target_entities(self.target_store)
 
     def set_target_fields(self, target_fields: List[str]):
         self.target_fields = list({self.target_id} | set(target_fields))
-        self.reduced_targets = MatchRuleHelper.reduced_entities(
-            self.target_entities, self.target_fields
-        )
+        self._reduced_targets = None
         self.user_match_editor.set_target_fields(target_fields)
         self.rule_editor.target_field_selector.set_fields(target_fields)
 
     def set_sources(self, sources):
-        self.sources = sources
-        self.source_entities = [
-            MatchRuleHelper.flatten(source) for source in self.sources
-        ]
-        self.source_all_fields = list(
-            {k for k in entity} for entity in self.source_entities
-        )
-        self.source_by_id = {s[self.source_id]: s for s in self.source_entities}
-        self.reduced_sources = MatchRuleHelper.reduced_entities(
-            self.source_entities, self.source_fields
-        )
-        self.user_match_editor.set_source_entities(self.source_entities)
+        self.set_source_store(EntityStore(sources, self.source_id))
+
+    def set_source_store(self, source_store: EntityStore):
+        self.source_store = source_store
+        self._reduced_sources = None
+        self.user_match_editor.set_source_entities(self.source_store)
 
     def set_source_fields(self, source_fields: List[str]):
         self.source_fields = list({self.source_id} | set(source_fields))
-        self.reduced_sources = MatchRuleHelper.reduced_entities(
-            self.source_entities, self.source_fields
-        )
+        self._reduced_sources = None
         self.user_match_editor.set_source_fields(source_fields)
         self.rule_editor.source_field_selector.set_fields(source_fields)
 
     def add_match(self, list_name: str, match: Tuple):
-        match_list = self.user_match_lists[list_name]
-        if None in match or match in match_list:
+        if None in match or not self.user_match_lists[list_name].add(match):
             return False
-        match_list.append(match)
-        (
-            self.user_unambiguous[list_name],
-            self.user_ambiguous[list_name],
-        ) = MatchRuleHelper.calculate_ambiguous_and_not(match_list)
-        self.user_match_editor.set_match_options()
-        self.comparator.set_compare_options(None)
+        self.refresh.mark(USER_MATCHES, COMPARE_OPTIONS, COMPARISON)
 
     def remove_match(self, list_name: str, match: Tuple):
-        match_list = self.user_match_lists[list_name]
-        if match not in match_list:
+        if not self.user_match_lists[list_name].remove(match):
             return False
-        match_list.remove(match)
-        self.user_match_editor.set_match_options()
-        self.comparator.set_compare_options(None)
+        self.refresh.mark(USER_MATCHES, COMPARE_OPTIONS, COMPARISON)
+
+    def entities_fingerprint(self) -> Tuple[str, str]:
+        return (
+            self.source_store.fingerprint(self.source_fields),
+            self.target_store.fingerprint(self.target_fields),
+        )
 
     def get_match_options(
-        self, tuple_list: List[Tuple], source_field: str, target_field: str
+        self, tuple_list: Iterable[Tuple], source_field: str, target_field: str
     ):
         return [
             (
                 (
-                    self.source_by_id[match[0]].get(source_field),
-                    self.target_by_id[match[1]].get(target_field),
+                    self.source_store.get(match[0], source_field),
+                    self.target_store.get(match[1], target_field),
                 ),
                 match,
             )
@@ -223,25 +371,27 @@ class MatchRuleHelper:
         ]
 
     def get_source_tuple(self, id, field):
-        return (self.source_by_id[id][field], id)
+        return (self.source_store.get(id, field), id)
 
     def get_target_tuple(self, id, field):
-        return (self.target_by_id[id][field], id)
+        return (self.target_store.get(id, field), id)
 
     def edit_user_matches(self):
+        self.refresh.show(USER_MATCHES)
         self.user_match_editor.display()
 
     def edit_rules(self):
+        self.refresh.show(RULE_MATCHES)
         display(self.rule_editor.widget)
 
     def add_match_set(self, name, matches):
         if name in self.user_match_lists:
             print(f"{name} is already a user match list")
             return
-        matches = [
+        matches = MatchList(
             m if isinstance(m, tuple) else MatchRuleHelper.dict_to_match(m)
             for m in matches
-        ]
+        )
         self.user_match_lists[name] = matches
         self.user_match_editor.match_list_selector.options = [
             name for name in self.user_match_lists
@@ -249,13 +399,14 @@ class MatchRuleHelper:
         self.rule_editor.user_match_list_widget.options = [
             name for name in self.user_match_lists
         ]
-        good, bad = MatchRuleHelper.calculate_ambiguous_and_not(matches)
-        self.user_unambiguous[name] = good
-        self.user_ambiguous[name] = bad
+        self.user_unambiguous[name] = matches.unambiguous
+        self.user_ambiguous[name] = matches.ambiguous
 
-        self.comparator.set_compare_options(None)
+        self.refresh.mark(COMPARE_OPTIONS, COMPARISON)
 
     def compare(self):
+        self.refresh.show(COMPARE_OPTIONS)
+        self.refresh.show(COMPARISON)
         display(self.comparator.widget)
 
     def to_json(self):
@@ -270,21 +421,50 @@ class MatchRuleHelper:
             },
             "rules": self.rule_editor.rules,
             "deleted_rules": self.rule_editor.deleted_rules,
-            "rule_status": self.rule_editor.status_by_rule_string,
+            "rule_status": self.rule_editor.status_by_rule,
         }
 
     @staticmethod
     def from_json(d):
         rule_helper = MatchRuleHelper(d["project"])
-        rule_helper.set_sources(d["sources"])
-        rule_helper.set_targets(d["targets"])
-        rule_helper.set_source_fields(d["source_fields"])
-        rule_helper.set_target_fields(d["target_fields"])
-        for name, match_list in d["match_lists"].items():
-            rule_helper.add_match_set(name, [tuple(l) for l in match_list])
-        rule_helper.rule_editor.add_rules(d["rules"])
-        rule_helper.rule_editor.deleted_rules = d["deleted_rules"]
-        rule_helper.rule_editor.status_by_rule_string = d["rule_status"]
+        with rule_helper.batch():
+            rule_helper.set_sources(d["sources"])
+            rule_helper.set_targets(d["targets"])
+            rule_helper.set_source_fields(d["source_fields"])
+            rule_helper.set_target_fields(d["target_fields"])
+            for name, match_list in d["match_lists"].items():
+                rule_helper.add_match_set(name, [tuple(l) for l in match_list])
+            rule_helper.rule_editor.add_rules(d["rules"])
+            rule_helper.rule_editor.deleted_rules = d["deleted_rules"]
+            rule_helper.rule_editor.status_by_rule = {
+                RuleEditor.stored_rule_key(k): v for k, v in d["rule_status"].items()
+            }
+        return rule_helper
+
+    def save(self, path: str):
+        # A directory with the entities as columns and the match lists and rule results
+        # as id arrays, which loads much faster than to_json for large projects
+        save_session(self, path)
+
+    @staticmethod
+    def load(path: str, client: Optional[CogniteClient] = None, **kwargs):
+        # Restores a session saved with save. Without a client the session is opened
+        # offline, and the saved rule results are used without calling the API.
+        if "offline" in kwargs:
+            raise TypeError(
+                "load does not take offline, it is opened offline unless a client is given"
+            )
+        with open(os.path.join(path, MANIFEST), "r") as f:
+            project = json.load(f)["project"]
+        rule_helper = MatchRuleHelper(project, offline=True, **kwargs)
+        if client is not None:
+            rule_helper.client = client
+            rule_helper.rule_editor.client = client
+            rule_helper.resource_helper = ResourceHelper(
+                client, rule_helper.partitions, rule_helper.cache_dir
+            )
+        with rule_helper.batch():
+            load_session(rule_helper, path)
         return rule_helper
 
     @staticmethod
@@ -311,14 +491,7 @@ class MatchRuleHelper:
 
     @staticmethod
     def flatten(entity: Dict):
-        flattened = {
-            **{k: v for k, v in entity.items() if not isinstance(v, (dict, list))},
-            **{
-                "metadata." + k: entity.get("metadata").get(k)
-                for k in entity.get("metadata", {})
-            },
-        }
-        return flattened
+        return flatten(entity)
 
     @staticmethod
     def match_to_dict(match: Tuple) -> Dict:
@@ -331,11 +504,51 @@ class MatchRuleHelper:
         )
 
 
+class SubstringIndex:
+    # All values joined into one string, so a search is a few str.find calls instead
+    # of a Python loop over every value. The rows found for the last substring are
+    # kept, so a substring that extends it only rechecks those rows and continues the
+    # scan where the last one stopped.
+    def __init__(self, values: List[str]):
+        self.values = values
+        self.text = SEPARATOR.join(values) + SEPARATOR
+        self.starts = list(accumulate([0] + [len(v) + 1 for v in values]))
+        self._substring = None
+        self._rows = []
+        self._position = 0
+
+    def search(self, substring: str, limit: int, skip=lambda row: False) -> List[int]:
+        if not substring:
+            return list(
+                islice((r for r in range(len(self.values)) if not skip(r)), limit)
+            )
+        if SEPARATOR in substring:
+            return []
+        if self._substring is not None and self._substring in substring:
+            rows = [row for row in self._rows if substring in self.values[row]]
+            position = self._position
+        else:
+            rows, position = [], 0
+        found = [row for row in rows if not skip(row)][:limit]
+        while len(found) < limit and position < len(self.text):
+            hit = self.text.find(substring, position)
+            if hit < 0:
+                position = len(self.text)
+                break
+            row = bisect_right(self.starts, hit) - 1
+            position = self.starts[row + 1]
+            rows.append(row)
+            if not skip(row):
+                found.append(row)
+        self._substring, self._rows, self._position = substring, rows, position
+        return found
+
+
 class EntitySelector:
     def __init__(
         self,
         title: str,
-        entities: List[Dict],
+        entities: EntityStore,
         display_field: str,
         id_field: str,
         style: Dict = None,
@@ -348,6 +561,7 @@ class EntitySelector:
         self.id_field = id_field
         self.limit = 100
         self.substring = ""
+        self.index_by_field = {}
 
         self.entity_dropdown = widgets.Dropdown(
             options=self.get_options(),
@@ -359,13 +573,25 @@ class EntitySelector:
         )
         self.widget = self.entity_dropdown
 
+    def _get_index(self) -> SubstringIndex:
+        if self.display_field not in self.index_by_field:
+            self.index_by_field[self.display_field] = SubstringIndex(
+                [
+                    NO_VALUE if v is None else str(v)
+                    for v in self.entities.column(self.display_field)
+                ]
+            )
+        return self.index_by_field[self.display_field]
+
     def get_options(self):
-        all_options = [
-            (e.get(self.display_field, "No value"), e[self.id_field])
-            for e in self.entities
-            if e[self.id_field] not in self.filtered
+        ids = self.entities.column(self.id_field)
+        values = self.entities.column(self.display_field)
+        rows = self._get_index().search(
+            self.substring, self.limit, lambda row: ids[row] in self.filtered
+        )
+        return [
+            (NO_VALUE if values[row] is None else values[row], ids[row]) for row in rows
         ]
-        return [e for e in all_options if self.substring in str(e[0])][: self.limit]
 
     def _set_options(self):
         options = self.get_options()
@@ -390,6 +616,7 @@ class EntitySelector:
 
     def set_entities(self, entities):
         self.entities = entities
+        self.index_by_field = {}
         self._set_options()
 
 
@@ -420,6 +647,87 @@ class FieldSelector:
         self.widget.observe(handler=action, names=["value"])
 
 
+class OptionPager:
+    # Shows a long list of options one page at a time in a dropdown, with buttons for
+    # the previous and next page and a field to jump to an offset. Only the options on
+    # the visible page are fetched and formatted, and the total is the count of the
+    # list, so the full list of options is never built.
+    def __init__(self, dropdown: widgets.Dropdown, page_size: int = 100):
+        self.dropdown = dropdown
+        self.page_size = page_size
+        self.count = 0
+        self.offset = 0
+        self.fetch = lambda offset, limit: []
+        self.key = None
+
+        button_layout = widgets.Layout(width="40px")
+        self.previous_button = widgets.Button(description="<", layout=button_layout)
+        self.previous_button.on_click(
+            lambda _: self.show_page(self.offset - self.page_size)
+        )
+        self.next_button = widgets.Button(description=">", layout=button_layout)
+        self.next_button.on_click(
+            lambda _: self.show_page(self.offset + self.page_size)
+        )
+        self.offset_text = widgets.BoundedIntText(
+            value=1,
+            min=1,
+            max=1,
+            description="From",
+            continuous_update=False,
+            layout=widgets.Layout(width="160px"),
+        )
+        self.offset_text.observe(
+            lambda change: self.show_page(change["new"] - 1), names="value"
+        )
+        self.label = widgets.Label()
+        # The pager takes the place and the size of the dropdown
+        self.widget = widgets.VBox(
+            [
+                dropdown,
+                widgets.HBox(
+                    [
+                        self.previous_button,
+                        self.next_button,
+                        self.offset_text,
+                        self.label,
+                    ]
+                ),
+            ],
+            layout=dropdown.layout,
+        )
+        dropdown.layout = widgets.Layout(width="99%")
+
+    def set_options(self, count: int, fetch: Callable[[int, int], List], key=None):
+        # fetch(offset, limit) returns the options of a page. `key` identifies the list:
+        # a list that changes keeps its page, and another list starts at the first page.
+        if key != self.key:
+            self.key, self.offset = key, 0
+        self.count, self.fetch = count, fetch
+        self.show_page(self.offset, force=True)
+
+    def show_page(self, offset: int, force=False):
+        # Pages start at multiples of the page size
+        offset = max(0, min(offset, self.count - 1))
+        offset -= offset % self.page_size
+        if offset == self.offset and not force:
+            return
+        self.offset = offset
+        options = self.fetch(offset, self.page_size) if self.count else []
+        if self.dropdown.value not in [value for _, value in options]:
+            self.dropdown.value = None
+        self.dropdown.options = options
+
+        self.offset_text.max = max(self.count, 1)
+        self.offset_text.value = offset + 1
+        self.previous_button.disabled = offset == 0
+        self.next_button.disabled = offset + self.page_size >= self.count
+        if options:
+            self.label.value = f"{offset + 1}-{offset + len(options)} of {self.count}"
+        else:
+            self.label.value = f"0 of {self.count}"
+
+
 class UserMatchEditor:
     def __init__(self, match_rule_helper: MatchRuleHelper):
         self.match_rule_helper = match_rule_helper
@@ -430,7 +738,7 @@ class UserMatchEditor:
 
         self.source_selector = EntitySelector(
             "Source",
-            self.match_rule_helper.source_entities,
+            self.match_rule_helper.source_store,
             self.match_rule_helper.source_id,
             self.match_rule_helper.source_id,
             style=style,
@@ -446,7 +754,7 @@ class UserMatchEditor:
 
         self.target_selector = EntitySelector(
             "Target",
-            self.match_rule_helper.target_entities,
+            self.match_rule_helper.target_store,
             self.match_rule_helper.target_id,
             self.match_rule_helper.target_id,
             style=style,
@@ -473,13 +781,15 @@ class UserMatchEditor:
         )
 
         self.match_selector = widgets.Dropdown(
-            options=self._get_match_options(),
+            options=[],
             value=None,
             description=MATCHES,
             disabled=False,
             style=style,
             layout=lay50,
         )
+        self.match_pager = OptionPager(self.match_selector)
+        self.set_match_options()
 
         self.add_match_button = widgets.Button(
             description="Add match", style=style, layout=lay50
@@ -525,17 +835,18 @@ class UserMatchEditor:
             lambda x: self.source_selector.set_display_field(
                 self.source_field_selector.get_field()
             )
-            or self.set_match_options()
+            or self.match_rule_helper.refresh.mark(USER_MATCHES)
         )
         self.target_field_selector.observe(
             lambda x: self.target_selector.set_display_field(
                 self.target_field_selector.get_field()
             )
-            or self.set_match_options()
+            or self.match_rule_helper.refresh.mark(USER_MATCHES)
         )
 
         self.match_list_selector.observe(
-            handler=self.set_match_options, names=["value"]
+            handler=lambda _: self.match_rule_helper.refresh.mark(USER_MATCHES),
+            names=["value"],
         )
 
         self.widget = widgets.VBox(
@@ -550,23 +861,30 @@ class UserMatchEditor:
                 widgets.HBox(
                     [self.source_selector.widget, self.target_selector.widget]
                 ),
-                widgets.HBox([self.match_list_selector, self.match_selector]),
+                widgets.HBox([self.match_list_selector, self.match_pager.widget]),
                 widgets.HBox([self.add_match_button, self.remove_match_button]),
             ]
         )
 
-    def _get_match_options(self, limit: int = 100):
+    def _get_match_options(self, offset: int = 0, limit: int = 100):
         return self.match_rule_helper.get_match_options(
-            self.match_rule_helper.user_match_lists[self.match_list_selector.value],
+            islice(
+                self.match_rule_helper.user_match_lists[self.match_list_selector.value],
+                offset,
+                offset + limit,
+            ),
             self.source_field_selector.get_field(),
             self.target_field_selector.get_field(),
-        )[:limit]
+        )
 
     def set_match_options(self, button=None):
-        options = self._get_match_options()
-        if self.match_selector.value not in options:
-            self.match_selector.value = None
-        self.match_selector.options = options
+        self.match_pager.set_options(
+            len(
+                self.match_rule_helper.user_match_lists[self.match_list_selector.value]
+            ),
+            self._get_match_options,
+            self.match_list_selector.value,
+        )
 
     def _add_match(self, button):
         source_id = self.source_selector.get_entity_id()
@@ -599,17 +917,27 @@ class RuleEditor:
         self.match_rule_helper = match_rule_helper
         self.client = self.match_rule_helper.client
 
-        self.status_by_rule_string = {}
+        self.status_by_rule = {}
         self.rules = []
+        self.rule_keys = []
         self.deleted_rules = []
         self.status = "Ready"
         self.delete_changes = set()
         self.uncalculated_rules = False
 
-        self.matches = []
-        self.ambiguous_matches = []
+        self.rule_matches = MatchList()
+        self.matches = self.rule_matches.unambiguous
+        self.ambiguous_matches = self.rule_matches.ambiguous
 
         self.applied_rules = []
+        self.render_cache = RenderCache()
+
+        # The apply result of each rule, for the entities with the given fingerprint
+        self.apply_cache = {}
+        self.apply_cache_fingerprint = None
+        # The conflicts and overlaps of the rules with these keys and fingerprint
+        self.relations = []
+        self.relations_key = None
 
         style = {"description_width": "20%"}
         style_2 = {"description_width": "40%"}
@@ -663,8 +991,8 @@ class RuleEditor:
             layout=lay50,
         )
 
-        self.source_field_selector.observe(self._update_rule_matches_and_info)
-        self.target_field_selector.observe(self._update_rule_matches_and_info)
+        self.source_field_selector.observe(self._mark_rule_matches)
+        self.target_field_selector.observe(self._mark_rule_matches)
 
         self.rule_matches_widget = widgets.Dropdown(
             options=[],
@@ -687,12 +1015,11 @@ class RuleEditor:
             value=None, description="Target:", style=style, layout=lay50
         )
 
+        self.rule_matches_pager = OptionPager(self.rule_matches_widget)
         self.rule_matches_widget.observe(
             handler=self._update_rule_match_info, names=["value"]
         )
-        self.rule_widget.observe(
-            handler=self._update_rule_matches_and_info, names="value"
-        )
+        self.rule_widget.observe(handler=self._mark_rule_matches, names="value")
 
         self.rule_action_widget = widgets.Dropdown(
             description="Status:",
@@ -720,7 +1047,7 @@ class RuleEditor:
                 widgets.HBox([self.rule_widget, self.rule_action_widget]),
                 widgets.HBox(
                     [
-                        self.rule_matches_widget,
+                        self.rule_matches_pager.widget,
                         self.number_of_matches_widget,
                         self.priority_widget,
                     ]
@@ -731,7 +1058,7 @@ class RuleEditor:
         )
 
         self.user_match_list_widget.observe(
-            handler=self._update_rule_info_widget, names=["value"]
+            handler=self._mark_rule_matches, names=["value"]
         )
 
         self.fancy_match = widgets.HTML(value=None, layout=lay100)
@@ -759,23 +1086,27 @@ class RuleEditor:
             return
         rule = self.rules[rule_index]
         options = [t[1] for t in self.rule_matches_widget.options]
-        match_index = options.index(rule_match)
-        info = self.rule_info[str(rule)]
-        extractors = _label_groups(
-            copy.deepcopy(rule["extractors"]), rule["conditions"]
+        match_index = self.rule_matches_pager.offset + options.index(rule_match)
+        key = self.rule_keys[rule_index]
+        info = self.rule_info[key]
+        extractors, compiled = self.render_cache.get(key, rule)
+        self.fancy_match.value = _color_match(
+            extractors, info["matches"][match_index], compiled
         )
-        self.fancy_match.value = _color_match(extractors, info["matches"][match_index])
 
     def _set_status(self, value):
         self.status = value
         self.status_widget.value = f"<b>{self.status}</b>"
 
-    def add_rule(self, rule):
-        string = str(rule)
-        if string in self.status_by_rule_string:
+    def add_rule(self, rule, key: str = None):
+        # The key can be passed in when the caller has already computed it
+        if key is None:
+            key = rule_key(rule)
+        if key in self.status_by_rule:
             return False
-        self.status_by_rule_string[string] = UNHANDLED
+        self.status_by_rule[key] = UNHANDLED
         self.rules.append(rule)
+        self.rule_keys.append(key)
 
     def _check_status(self, f):
         return lambda x: self.status == READY and f(x)
@@ -802,38 +1133,97 @@ class RuleEditor:
 
     def _apply_rules(self, button=None):
         self._set_status(APPLYING_RULES)
-        self._clean_up_deleted_rules()
-        sources, targets = (
-            self.match_rule_helper.reduced_sources,
-            self.match_rule_helper.reduced_targets,
-        )
-        apply_response = self.client.match_rules.apply(sources, targets, self.rules)
-        apply_job_id = apply_response.job_id
-        self._set_status(APPLYING_RULES + f" job id: {apply_job_id}")
-
-        self.apply_result = apply_response.result
-        self.fancy_rules = apply_response.rules
-        self._update_rule_info(self.apply_result)
-        self.uncalculated_rules = False
-        self.match_rule_helper.comparator.set_compare_options(None)
-        self._set_status(READY)
+        # The status is set back to READY also when applying fails, for instance with
+        # rules that can not be applied offline, so the editor is not stuck
+        try:
+            self._clean_up_deleted_rules()
+            fingerprint = self.match_rule_helper.entities_fingerprint()
+            if fingerprint != self.apply_cache_fingerprint:
+                self.apply_cache = {}
+                self.apply_cache_fingerprint = fingerprint
+            new_rules = [
+                (rule, key)
+                for rule, key in zip(self.rules, self.rule_keys)
+                if key not in self.apply_cache
+            ]
+            sources, targets = (
+                self.match_rule_helper.reduced_sources,
+                self.match_rule_helper.reduced_targets,
+            )
+            if self.match_rule_helper.apply_locally:
+                local_rules = [(r, k) for r, k in new_rules if is_supported(r)]
+                new_rules = [(r, k) for r, k in new_rules if not is_supported(r)]
+                apply_result = apply_rules(
+                    sources,
+                    targets,
+                    [rule for rule, _ in local_rules],
+                    self.match_rule_helper.source_id,
+                    self.match_rule_helper.processes,
+                )
+                self._cache_results(
+                    [key for _, key in local_rules], apply_result["items"]
+                )
+            if new_rules and self.client is None:
+                raise ValueError(f"{len(new_rules)} rules can not be applied offline")
+            if new_rules:
+                apply_response = self.client.match_rules.apply(
+                    sources, targets, [rule for rule, _ in new_rules]
+                )
+                apply_job_id = apply_response.job_id
+                self._set_status(APPLYING_RULES + f" job id: {apply_job_id}")
+                self._cache_results(
+                    [key for _, key in new_rules], apply_response.result["items"]
+                )
+                self.fancy_rules = apply_response.rules
+
+            self._update_rule_info()
+            self.uncalculated_rules = False
+            self.match_rule_helper.refresh.mark(COMPARE_OPTIONS, COMPARISON)
+        finally:
+            self._set_status(READY)
+
+    def _cache_results(self, keys: List[str], items: List[Dict]):
+        for key, item in zip(keys, items):
+            self.apply_cache[key] = {
+                "matches": item["matches"],
+                "numberOfMatches": item["numberOfMatches"],
+            }
 
-    def _update_rule_info(self, apply_result):
+    def _update_rule_info(self):
+        # Conflicts and overlaps depend on all the rules, so they are calculated from
+        # the matches of each rule rather than cached with them, and only again when
+        # the rules or the entities change
+        items = [self.apply_cache[key] for key in self.rule_keys]
+        match_tuples = [
+            [MatchRuleHelper.dict_to_match(d) for d in item["matches"]]
+            for item in items
+        ]
+        relations_key = (tuple(self.rule_keys), self.apply_cache_fingerprint)
+        if relations_key != self.relations_key:
+            self.relations = rule_relations(match_tuples)
+            self.relations_key = relations_key
+        self.apply_result = {
+            "items": [
+                {**item, **relations} for item, relations in zip(items, self.relations)
+            ]
+        }
         self.rule_info = {
-            str(rule): apply_result["items"][i] for i, rule in enumerate(self.rules)
+            key: {
+                **self.apply_result["items"][i],
+                "match_tuples": match_tuples[i],
+            }
+            for i, key in enumerate(self.rule_keys)
         }
 
-        matches = []
-        for info in self.rule_info.values():
-            info["match_tuples"] = [
-                MatchRuleHelper.dict_to_match(d) for d in info["matches"]
-            ]
-            matches.extend(info["match_tuples"])
-        (
-            self.matches,
-            self.ambiguous_matches,
-        ) = MatchRuleHelper.calculate_ambiguous_and_not(matches)
-        self._update_rule_info_widget(None)
+        self.rule_matches = MatchList(
+            match for tuples in match_tuples for match in tuples
+        )
+        self.matches = self.rule_matches.unambiguous
+        self.ambiguous_matches = self.rule_matches.ambiguous
+        self.match_rule_helper.refresh.mark(RULE_MATCHES)
+
+    def _mark_rule_matches(self, _=None):
+        self.match_rule_helper.refresh.mark(RULE_MATCHES)
 
     def _update_rule_info_widget(self, _):
         rule_options = [i for i, _ in enumerate(self.rules)]
@@ -847,11 +1237,9 @@ class RuleEditor:
         self._update_rule_matches_and_info(None)
 
     def _update_rule_matches_and_info(self, _):
-        limit = 100
         rule_number = self.rule_widget.value
         if rule_number is None:
-            self.rule_matches_widget.value = None
-            self.rule_matches_widget.options = []
+            self.rule_matches_pager.set_options(0, lambda offset, limit: [], None)
             self.number_of_matches_widget.value = ""
             self.priority_widget.value = ""
             self.rule_action_widget.value = UNHANDLED
@@ -859,25 +1247,24 @@ class RuleEditor:
             overlaps = []
         else:
             rule = self.rules[rule_number]
-            rule_string = str(rule)
-            match_tuples = self.rule_info[rule_string]["match_tuples"]
-            options = self.match_rule_helper.get_match_options(
-                match_tuples,
-                self.source_field_selector.get_field(),
-                self.target_field_selector.get_field(),
-            )[:limit]
-            if self.rule_matches_widget.value not in options:
-                self.rule_matches_widget.value = None
-            self.rule_matches_widget.options = options
-            info = self.rule_info[str(self.rules[rule_number])]
+            key = self.rule_keys[rule_number]
+            match_tuples = self.rule_info[key]["match_tuples"]
+            source_field = self.source_field_selector.get_field()
+            target_field = self.target_field_selector.get_field()
+            self.rule_matches_pager.set_options(
+                len(match_tuples),
+                lambda offset, limit: self.match_rule_helper.get_match_options(
+                    match_tuples[offset : offset + limit], source_field, target_field
+                ),
+                key,
+            )
+            info = self.rule_info[key]
             self.number_of_matches_widget.value = str(info["numberOfMatches"])
             self.priority_widget.value = str(rule["priority"])
-            self.rule_action_widget.value = self.status_by_rule_string.get(
-                rule_string, UNHANDLED
-            )
+            self.rule_action_widget.value = self.status_by_rule.get(key, UNHANDLED)
 
-            conflicts = self.rule_info[rule_string].get("conflicts")
-            overlaps = self.rule_info[rule_string].get("overlaps")
+            conflicts = info.get("conflicts")
+            overlaps = info.get("overlaps")
         self.conflict_dropdown.description = f"{len(conflicts)} conflicting rules"
         self.conflict_dropdown.value = None
         self.conflict_dropdown.options = [
@@ -901,19 +1288,15 @@ class RuleEditor:
             self.target_match_widget.value = ""
         else:
             self.source_match_widget.value = json.dumps(
-                {
-                    k: v
-                    for k, v in self.match_rule_helper.source_by_id[match[0]].items()
-                    if k in self.match_rule_helper.source_fields
-                },
+                self.match_rule_helper.source_store.record(
+                    match[0], self.match_rule_helper.source_fields
+                ),
                 indent=2,
             )
             self.target_match_widget.value = json.dumps(
-                {
-                    k: v
-                    for k, v in self.match_rule_helper.target_by_id[match[1]].items()
-                    if k in self.match_rule_helper.target_fields
-                },
+                self.match_rule_helper.target_store.record(
+                    match[1], self.match_rule_helper.target_fields
+                ),
                 indent=2,
             )
         self.display_fancy_match()
@@ -921,8 +1304,8 @@ class RuleEditor:
     def _rule_action(self, _):
         rule_i = self.rule_widget.value
         if rule_i is not None:
-            rule = self.rules[rule_i]
-            self.status_by_rule_string[str(rule)] = self.rule_action_widget.value
+            key = self.rule_keys[rule_i]
+            self.status_by_rule[key] = self.rule_action_widget.value
             if self.rule_action_widget.value == DELETED:
                 self.delete_changes.add(rule_i)
             elif rule_i in self.delete_changes:
@@ -942,6 +1325,9 @@ class RuleEditor:
         self.rules = [
             r for i, r in enumerate(self.rules) if i not in self.delete_changes
         ]
+        self.rule_keys = [
+            k for i, k in enumerate(self.rule_keys) if i not in self.delete_changes
+        ]
         self.delete_changes = set()
         self._notice_changes()
 
@@ -956,13 +1342,21 @@ class RuleEditor:
             return False
         old_len_rules = len(self.rules)
         for rule in rules:
-            if hard and self.status_by_rule_string.get(str(rule)) == DELETED:
-                self.status_by_rule_string.pop(str(rule))
-            self.add_rule(rule)
+            key = rule_key(rule)
+            if hard and self.status_by_rule.get(key) == DELETED:
+                self.status_by_rule.pop(key)
+            self.add_rule(rule, key)
         if old_len_rules != len(self.rules):
             self.uncalculated_rules = True
             self._apply_rules()
 
+    @staticmethod
+    def stored_rule_key(key: str) -> str:
+        # Sessions saved before rules were hashed use the rule as a string as the key
+        if key.startswith("{"):
+            return rule_key(ast.literal_eval(key))
+        return key
+
     @staticmethod
     def conflict_to_string(conflict):
         return f"Rule#{conflict['ruleIndex']}: {conflict['multiplicity']}"
@@ -979,6 +1373,7 @@ class MatchComparator:
         self.target_field_selector = (
             self.match_rule_helper.user_match_editor.target_field_selector
         )
+        self.arrays_by_key = {}
 
         style = {"description_width": "20%"}
         self.first_list_selector = widgets.Dropdown(
@@ -1021,120 +1416,169 @@ class MatchComparator:
         )
 
         self.first_list_selector.observe(
-            self._combine_lists, names=["value", "options"]
+            self._mark_comparison, names=["value", "options"]
         )
         self.second_list_selector.observe(
-            self._combine_lists, names=["value", "options"]
+            self._mark_comparison, names=["value", "options"]
         )
 
         self.disagreement_list.observe(
             self._select_disagreed, names=["value", "options"]
         )
 
+        self.agreed_pager = OptionPager(self.agreed_list)
+        self.first_only_pager = OptionPager(self.first_only_list)
+        self.second_only_pager = OptionPager(self.second_only_list)
+        self.first_ambiguous_pager = OptionPager(self.first_ambiguous)
+        self.second_ambiguous_pager = OptionPager(self.second_ambiguous)
+        self.disagreement_pager = OptionPager(self.disagreement_list)
+
+        self.agreement_button = widgets.Button(
+            description="Compare all lists", layout=widgets.Layout(width="50%")
+        )
+        self.agreement_button.on_click(self._show_agreement)
+        self.agreement_table = widgets.HTML(layout=widgets.Layout(width="99%"))
+
         self.widget = widgets.VBox(
             [
                 widgets.HBox([self.first_list_selector, self.second_list_selector]),
-                widgets.HBox([self.first_only_list, self.second_only_list]),
-                widgets.HBox([self.first_ambiguous, self.second_ambiguous]),
-                self.agreed_list,
-                self.disagreement_list,
+                widgets.HBox(
+                    [self.first_only_pager.widget, self.second_only_pager.widget]
+                ),
+                widgets.HBox(
+                    [
+                        self.first_ambiguous_pager.widget,
+                        self.second_ambiguous_pager.widget,
+                    ]
+                ),
+                self.agreed_pager.widget,
+                self.disagreement_pager.widget,
                 widgets.HBox([self.first_disagreed, self.second_disagreed]),
+                self.agreement_button,
+                self.agreement_table,
             ]
         )
 
-    def set_compare_options(self, _):
-        self.first_list_selector.value = RULE_OUTPUT
-        self.second_list_selector.value = DEFAULT
+    def _mark_comparison(self, _=None):
+        self.match_rule_helper.refresh.mark(COMPARISON)
+
+    def set_compare_options(self, _=None):
         self.first_list_selector.options = self._get_list_options()
         self.second_list_selector.options = self._get_list_options()
+        self.first_list_selector.value = RULE_OUTPUT
+        self.second_list_selector.value = DEFAULT
 
     def _get_list_options(self):
         return [RULE_OUTPUT] + [k for k in self.match_lists]
 
-    def _get_matches(self, key):
+    def _get_match_list(self, key) -> MatchList:
         if key == RULE_OUTPUT:
-            return self.rule_editor.matches, self.rule_editor.ambiguous_matches
-        else:
-            return (
-                self.match_rule_helper.user_unambiguous[key],
-                self.match_rule_helper.user_ambiguous[key],
-            )
+            return self.rule_editor.rule_matches
+        return self.match_lists[key]
+
+    def _get_matches(self, key):
+        match_list = self._get_match_list(key)
+        return match_list.unambiguous, match_list.ambiguous
+
+    def _get_arrays(self, key) -> MatchArrays:
+        # The arrays are rebuilt only when the list has changed since the last time
+        match_list = self._get_match_list(key)
+        cached = self.arrays_by_key.get(key)
+        if (
+            cached is None
+            or cached[0] is not match_list
+            or cached[1] != match_list.version
+        ):
+            cached = match_list, match_list.version, MatchArrays(match_list.unambiguous)
+            self.arrays_by_key[key] = cached
+        return cached[2]
+
+    def agreement_matrix(self, keys: List[str] = None) -> Tuple[List[str], np.ndarray]:
+        keys = keys or self._get_list_options()
+        return keys, agreement_matrix([self._get_arrays(key) for key in keys])
+
+    def _show_agreement(self, _=None):
+        keys, matrix = self.agreement_matrix()
+        header = "".join(f"<th>{key}</th>" for key in keys)
+        rows = "".join(
+            f"<tr><th>{key}</th>" + "".join(f"<td>{n}</td>" for n in row) + "</tr>"
+            for key, row in zip(keys, matrix.tolist())
+        )
+        self.agreement_table.value = f"<table><tr><th></th>{header}</tr>{rows}</table>"
 
     def _combine_lists(self, _=None):
+        # Only the visible page of each list is formatted, see OptionPager
         first = self.first_list_selector.value
         second = self.second_list_selector.value
         source_field = self.source_field_selector.get_field()
         target_field = self.target_field_selector.get_field()
+        get_match_options = self.match_rule_helper.get_match_options
 
-        matches = {key: self._get_matches(key) for key in [first, second]}
-
-        self.first_ambiguous.value = None
-        options = [
-            self.match_rule_helper.get_source_tuple(x, source_field)
-            for x in matches[first][1]
-        ]
-        self.first_ambiguous.options = options[:100]
-        self.first_ambiguous.description = f"{len(options)} ambiguous"
+        def source_options(sources):
+            return [
+                self.match_rule_helper.get_source_tuple(x, source_field)
+                for x in sources
+            ]
 
-        self.second_ambiguous.value = None
-        options = [
-            self.match_rule_helper.get_source_tuple(x, source_field)
-            for x in matches[second][1]
-        ]
-        self.second_ambiguous.options = options[:100]
-        self.second_ambiguous.description = f"{len(options)} ambiguous"
+        matches = {key: self._get_matches(key) for key in [first, second]}
 
-        match_dicts = {
-            key: {m[0]: m[1] for m in matches[key][0]} for key in [first, second]
-        }
+        for key, pager in [
+            (first, self.first_ambiguous_pager),
+            (second, self.second_ambiguous_pager),
+        ]:
+            ambiguous = matches[key][1]
+            pager.set_options(
+                len(ambiguous),
+                lambda offset, limit, ambiguous=ambiguous: source_options(
+                    islice(ambiguous, offset, offset + limit)
+                ),
+                key,
+            )
+            pager.dropdown.description = f"{len(ambiguous)} ambiguous"
 
-        agreed = [
-            (k, v)
-            for k, v in match_dicts[first].items()
-            if match_dicts[second].get(k) == v
-        ]
-        disagreed = [
-            k
-            for k, v in match_dicts[first].items()
-            if match_dicts[second].get(k) not in {None, v}
-        ]
-        just_first = [
-            (k, v)
-            for k, v in match_dicts[first].items()
-            if k not in match_dicts[second]
-        ]
-        just_second = [
-            (k, v)
-            for k, v in match_dicts[second].items()
-            if k not in match_dicts[first]
-        ]
+        comparison = Comparison(self._get_arrays(first), self._get_arrays(second))
 
-        self.agreed_list.value = None
-        self.agreed_list.options = self.match_rule_helper.get_match_options(
-            agreed[:100], source_field, target_field
+        self.agreed_pager.set_options(
+            len(comparison.agreed_sources),
+            lambda offset, limit: get_match_options(
+                comparison.agreed(limit, offset), source_field, target_field
+            ),
+            (first, second),
+        )
+        self.agreed_list.description = (
+            f"Agree on {len(comparison.agreed_sources)} matches:"
         )
-        self.agreed_list.description = f"Agree on {len(agreed)} matches:"
 
-        self.disagreement_list.value = None
-        self.disagreement_list.options = [
-            self.match_rule_helper.get_source_tuple(x, source_field)
-            for x in disagreed[:100]
-        ]
-        self.disagreement_list.description = f"Disagree on {len(disagreed)} matches:"
+        self.disagreement_pager.set_options(
+            len(comparison.disagreed_sources),
+            lambda offset, limit: source_options(comparison.disagreed(limit, offset)),
+            (first, second),
+        )
+        self.disagreement_list.description = (
+            f"Disagree on {len(comparison.disagreed_sources)} matches:"
+        )
 
-        self.first_only_list.value = None
-        options = self.match_rule_helper.get_match_options(
-            just_first, source_field, target_field
+        self.first_only_pager.set_options(
+            len(comparison.first_only_sources),
+            lambda offset, limit: get_match_options(
+                comparison.first_only(limit, offset), source_field, target_field
+            ),
+            (first, second),
+        )
+        self.first_only_list.description = (
+            f"{len(comparison.first_only_sources)} unique:"
         )
-        self.first_only_list.options = options[:100]
-        self.first_only_list.description = f"{len(options)} unique:"
 
-        self.second_only_list.value = None
-        options = self.match_rule_helper.get_match_options(
-            just_second, source_field, target_field
+        self.second_only_pager.set_options(
+            len(comparison.second_only_sources),
+            lambda offset, limit: get_match_options(
+                comparison.second_only(limit, offset), source_field, target_field
+            ),
+            (first, second),
+        )
+        self.second_only_list.description = (
+            f"{len(comparison.second_only_sources)} unique:"
         )
-        self.second_only_list.options = options[:100]
-        self.second_only_list.description = f"{len(options)} unique:"
 
     def _select_disagreed(self, _=None):
         source_id = self.disagreement_list.value
@@ -1142,32 +1586,48 @@ class MatchComparator:
             return
         first = self.first_list_selector.value
         second = self.second_list_selector.value
-        matches = {key: self._get_matches(key) for key in [first, second]}
-
-        first_target = (
-            [k[1] for k in matches[first][0] if k[0] == source_id] + [None]
-        )[0]
-        second_target = (
-            [k[1] for k in matches[second][0] if k[0] == source_id] + [None]
-        )[0]
+        first_target = self._get_match_list(first).target(source_id)
+        second_target = self._get_match_list(second).target(source_id)
 
         if None in (first_target, second_target):
             return
-        first_entity = self.match_rule_helper.target_by_id[first_target]
+        target_store = self.match_rule_helper.target_store
         self.first_disagreed.value = json.dumps(
-            {k: first_entity.get(k) for k in self.match_rule_helper.target_fields},
+            target_store.record(first_target, self.match_rule_helper.target_fields),
             indent=2,
         )
-
-        second_entity = self.match_rule_helper.target_by_id[second_target]
         self.second_disagreed.value = json.dumps(
-            {k: second_entity.get(k) for k in self.match_rule_helper.target_fields},
+            target_store.record(second_target, self.match_rule_helper.target_fields),
             indent=2,
         )
 
 
+class RenderCache:
+    # The labelled extractors and compiled patterns of the most recently displayed
+    # rules, so clicking through the matches of a rule does not relabel and recompile
+    def __init__(self, size: int = 128):
+        self.size = size
+        self._by_key = OrderedDict()
+
+    def get(self, key: str, rule: Dict) -> Tuple[List[Dict], List]:
+        if key in self._by_key:
+            self._by_key.move_to_end(key)
+            return self._by_key[key]
+        extractors = _label_groups(
+            copy.deepcopy(rule["extractors"]), rule["conditions"]
+        )
+        compiled = [
+            regex.compile(e["pattern"]) if e["extractorType"] == "regex" else None
+            for e in extractors
+        ]
+        self._by_key[key] = extractors, compiled
+        if len(self._by_key) > self.size:
+            self._by_key.popitem(last=False)
+        return extractors, compiled
+
+
 # Copied and modified from sdk
-def _color_match(extractors: List[Dict], match: Dict):
+def _color_match(extractors: List[Dict], match: Dict, compiled: List = None):
     columns = sorted(
         list(
             {
@@ -1176,25 +1636,17 @@ def _color_match(extractors: List[Dict], match: Dict):
             }
         )
     )  # order?
-    patterns = {
-        (extractor["entitySet"][:-1], extractor["field"]): extractor["pattern"].strip(
-            "^$"
-        )
-        for extractor in extractors
-        if extractor["extractorType"] == "regex"
-    }
     formatted = {
         "source": copy.copy(match.get("source")),
         "target": copy.copy(match.get("target")),
     }
-    for extractor in extractors:
+    for i, extractor in enumerate(extractors):
         if extractor["extractorType"] != "regex":
             continue
         source_target = extractor["entitySet"][:-1]  # singular
         field = extractor["field"]
-        regex_match = regex.match(
-            extractor["pattern"], match.get(source_target, {}).get(field, "")
-        )
+        pattern = compiled[i] if compiled else regex.compile(extractor["pattern"])
+        regex_match = pattern.match(match.get(source_target, {}).get(field, ""))
         if not regex_match:
             print(
                 "Unexpected lack of match of ",
@@ -0,0 +1,78 @@
+import asyncio
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+
+class RefreshScheduler:
+    # Changes mark the views that depend on them as dirty instead of recomputing them,
+    # and each dirty view is recomputed once when the changes have settled: at the end
+    # of the outermost batch, or `delay` seconds after the last change when the event
+    # loop of the kernel is running. Views that are not displayed yet stay dirty until
+    # they are shown.
+    def __init__(self, delay: float = 0.1):
+        self.delay = delay
+        self.views: Dict[str, Callable[[], None]] = {}
+        self.visible = set()
+        self.dirty = {}
+        self.depth = 0
+        self.refreshing = None
+        self._timer = None
+
+    def register(self, name: str, refresh: Callable[[], None], visible=True):
+        self.views[name] = refresh
+        if visible:
+            self.visible.add(name)
+
+    def show(self, name: str):
+        self.visible.add(name)
+        if name in self.dirty:
+            self.flush()
+
+    def mark(self, *names: str):
+        # A view that marks itself while it is being refreshed is not refreshed again
+        for name in names:
+            if name != self.refreshing:
+                self.dirty[name] = None
+        if self.depth == 0 and self.refreshing is None:
+            self._schedule()
+
+    @contextmanager
+    def batch(self):
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                self.flush()
+
+    def _schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or self.delay <= 0:
+            self.flush()
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(self.delay, self.flush)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # In the order the views were registered. A view can mark other views while
+        # it is refreshed.
+        while True:
+            name = next(
+                (n for n in self.views if n in self.dirty and n in self.visible), None
+            )
+            if name is None:
+                return
+            del self.dirty[name]
+            self.refreshing = name
+            try:
+                self.views[name]()
+            finally:
+                self.refreshing = None
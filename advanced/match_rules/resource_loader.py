@@ -0,0 +1,206 @@
+import gzip
+import json
+import os
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from cognite.experimental import CogniteClient
+
+ASSETS = "assets"
+TIME_SERIES = "timeseries"
+
+LIST_LIMIT = 1000
+CACHE_VERSION = 1
+LAST_UPDATED_TIME = "last_updated_time"
+
+
+def _root_filter(resource_type: str, root_id: int) -> Dict:
+    if resource_type == ASSETS:
+        return {"rootIds": [{"id": root_id}]}
+    return {"rootAssetIds": [root_id]}
+
+
+def _snake_case(key: str) -> str:
+    return re.sub("([A-Z])", r"_\1", key).lower()
+
+
+def _dump(item: Dict) -> Dict:
+    # The raw API item with the keys of Asset.dump() and TimeSeries.dump(), without
+    # building the SDK objects
+    return {_snake_case(k): v for k, v in item.items()}
+
+
+class ResourceCache:
+    # The entities of each (project, root id, resource type) as gzipped JSON, with the
+    # largest lastUpdatedTime, so only entities changed since then need to be fetched
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, project: str, root_id: int, resource_type: str) -> str:
+        return os.path.join(
+            self.directory, project, str(root_id), resource_type + ".json.gz"
+        )
+
+    def load(self, project: str, root_id: int, resource_type: str) -> Optional[Dict]:
+        path = self._path(project, root_id, resource_type)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            cached = json.load(f)
+        return cached if cached.get("version") == CACHE_VERSION else None
+
+    def save(self, project: str, root_id: int, resource_type: str, items: List[Dict]):
+        path = self._path(project, root_id, resource_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cached = {
+            "version": CACHE_VERSION,
+            "last_updated_time": max(
+                (item.get(LAST_UPDATED_TIME, 0) for item in items), default=0
+            ),
+            "items": items,
+        }
+        # Written next to the cache and then moved, so an interrupted save does not
+        # leave a broken cache
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump(cached, f)
+        os.replace(path + ".tmp", path)
+
+
+class ResourceLoader:
+    # Fetches the assets or time series under a root asset. With several partitions the
+    # partitions are fetched in parallel, and each page is passed on as it arrives.
+    def __init__(
+        self,
+        client: CogniteClient,
+        partitions: int = 5,
+        cache_dir: Optional[str] = None,
+    ):
+        self.client = client
+        self.partitions = partitions
+        self.cache = ResourceCache(cache_dir) if cache_dir else None
+
+    def count(self, resource_type: str, root_id: int) -> int:
+        response = self.client.post(
+            f"/{resource_type}/aggregate",
+            json={"filter": _root_filter(resource_type, root_id)},
+        )
+        return response.json()["items"][0]["count"]
+
+    def roots(
+        self, name: str = "", cursor: Optional[str] = None, limit: int = 100
+    ) -> Tuple[List[Dict], Optional[str]]:
+        # A page of root assets and the cursor of the next page. With a name, the roots
+        # are found by the search endpoint, which returns the best matches and has no
+        # further pages.
+        if name:
+            body = {"filter": {"root": True}, "search": {"name": name}, "limit": limit}
+            response = self.client.post("/assets/search", json=body).json()
+            return [_dump(item) for item in response["items"]], None
+        body = {"filter": {"root": True}, "limit": limit, "cursor": cursor}
+        response = self.client.post("/assets/list", json=body).json()
+        return [_dump(item) for item in response["items"]], response.get("nextCursor")
+
+    def _fetch(
+        self, resource_type: str, filter: Dict, partition: Optional[str], limit=-1
+    ) -> Iterator[List[Dict]]:
+        # A limit of -1 fetches everything
+        cursor = None
+        while limit != 0:
+            body = {"filter": filter, "limit": LIST_LIMIT, "cursor": cursor}
+            if partition:
+                body["partition"] = partition
+            if 0 < limit < LIST_LIMIT:
+                body["limit"] = limit
+            response = self.client.post(f"/{resource_type}/list", json=body).json()
+            yield [_dump(item) for item in response["items"]]
+            if limit > 0:
+                limit = max(0, limit - len(response["items"]))
+            cursor = response.get("nextCursor")
+            if cursor is None:
+                return
+
+    def pages(
+        self, resource_type: str, filter: Dict, limit: int = -1
+    ) -> Iterator[List[Dict]]:
+        # The pages of all partitions in the order they arrive. A limit is only
+        # supported without partitions.
+        if limit != -1 or self.partitions <= 1:
+            yield from self._fetch(resource_type, filter, None, limit)
+            return
+
+        pages = queue.Queue()
+
+        def fetch(partition: str):
+            try:
+                for page in self._fetch(resource_type, filter, partition):
+                    pages.put(page)
+            finally:
+                pages.put(None)
+
+        with ThreadPoolExecutor(max_workers=self.partitions) as executor:
+            futures = [
+                executor.submit(fetch, f"{i + 1}/{self.partitions}")
+                for i in range(self.partitions)
+            ]
+            running = len(futures)
+            while running:
+                page = pages.get()
+                if page is None:
+                    running -= 1
+                else:
+                    yield page
+            for future in futures:
+                future.result()
+
+    def load(
+        self,
+        resource_type: str,
+        root_id: int,
+        limit: int = -1,
+        on_page: Callable[[List[Dict]], None] = lambda page: None,
+        count: Optional[int] = None,
+    ) -> List[Dict]:
+        # All entities under the root, with on_page called on every page. A cached root
+        # is refreshed with the entities updated since it was saved. Deleted entities
+        # do not show up in such a refresh, so if the number of entities then differs
+        # from the number in CDF, everything is fetched again. The count can be given if
+        # it is already known.
+        filter = _root_filter(resource_type, root_id)
+        if self.cache is None or limit != -1:
+            return self._load_pages(self.pages(resource_type, filter, limit), on_page)
+
+        project = self.client.config.project
+        cached = self.cache.load(project, root_id, resource_type)
+        if cached is not None:
+            items_by_id = {item["id"]: item for item in cached["items"]}
+            since = {"lastUpdatedTime": {"min": cached["last_updated_time"]}}
+            updated = 0
+            for page in self.pages(resource_type, {**filter, **since}):
+                items_by_id.update((item["id"], item) for item in page)
+                updated += len(page)
+            if count is None:
+                count = self.count(resource_type, root_id)
+            if len(items_by_id) == count:
+                items = list(items_by_id.values())
+                on_page(items)
+                # The entities at the last lastUpdatedTime are always fetched again
+                if updated > sum(
+                    item.get(LAST_UPDATED_TIME) == cached["last_updated_time"]
+                    for item in items
+                ):
+                    self.cache.save(project, root_id, resource_type, items)
+                return items
+
+        items = self._load_pages(self.pages(resource_type, filter), on_page)
+        self.cache.save(project, root_id, resource_type, items)
+        return items
+
+    @staticmethod
+    def _load_pages(pages: Iterator[List[Dict]], on_page: Callable) -> List[Dict]:
+        items = []
+        for page in pages:
+            items.extend(page)
+            on_page(page)
+        return items
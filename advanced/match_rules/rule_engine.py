@@ -0,0 +1,241 @@
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from regex import regex
+
+SOURCES = "sources"
+TARGETS = "targets"
+
+# Smaller entity sets are not worth sending to other processes
+MIN_SHARD_SIZE = 10000
+
+
+def rule_key(rule: Dict) -> str:
+    # A hash of the content of the rule, which does not depend on the order of the keys
+    content = json.dumps(rule, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+def rule_relations(match_tuples_by_rule: List[List[Tuple]]) -> List[Dict]:
+    # The conflicts and overlaps of every rule with the other rules, in the format of
+    # match_rules.apply. Two rules conflict on a source they match to different targets,
+    # and overlap on a source they match to a same target. The multiplicity is the
+    # number of such sources. The targets are grouped by source and rule first, so the
+    # cost grows with the number of rules matching a source, not with its matches.
+    targets_by_source = {}
+    for rule_index, match_tuples in enumerate(match_tuples_by_rule):
+        for source, target in match_tuples:
+            rules = targets_by_source.setdefault(source, {})
+            rules.setdefault(rule_index, set()).add(target)
+
+    conflicts = [{} for _ in match_tuples_by_rule]
+    overlaps = [{} for _ in match_tuples_by_rule]
+    for rules in targets_by_source.values():
+        if len(rules) < 2:
+            continue
+        for i, targets in rules.items():
+            single = len(targets) == 1
+            for j, others in rules.items():
+                if i == j:
+                    continue
+                if not targets.isdisjoint(others):
+                    overlaps[i][j] = overlaps[i].get(j, 0) + 1
+                if not (single and targets == others):
+                    conflicts[i][j] = conflicts[i].get(j, 0) + 1
+    return [
+        {
+            "conflicts": [
+                {"ruleIndex": j, "multiplicity": n} for j, n in sorted(c.items())
+            ],
+            "overlaps": [
+                {"ruleIndex": j, "multiplicity": n} for j, n in sorted(o.items())
+            ],
+        }
+        for c, o in zip(conflicts, overlaps)
+    ]
+
+
+def is_supported(rule: Dict) -> bool:
+    return all(e["extractorType"] == "regex" for e in rule["extractors"]) and all(
+        c["conditionType"] == "equals" for c in rule["conditions"]
+    )
+
+
+class _Columns(dict):
+    # The values of a field for all entities, taken from the entities when first used
+    def __init__(self, entities: List[Dict]):
+        super().__init__()
+        self.entities = entities
+
+    def __missing__(self, field: str) -> List:
+        self[field] = [e.get(field) for e in self.entities]
+        return self[field]
+
+
+def _extract(columns: Dict[str, List], extractor: Dict, extractions: Dict) -> List:
+    # The groups of the extractor pattern for every entity, or None where it does not
+    # match. Rules often share extractors, so the groups are kept for the other rules.
+    key = (extractor["entitySet"], extractor["field"], extractor["pattern"])
+    if key not in extractions:
+        match = regex.compile(extractor["pattern"]).match
+        extractions[key] = [
+            _groups(match("" if value is None else str(value)))
+            for value in columns[extractor["field"]]
+        ]
+    return extractions[key]
+
+
+def _groups(match) -> Optional[Tuple]:
+    return match.groups() if match else None
+
+
+def _join_keys(
+    rule: Dict,
+    entity_set: str,
+    columns: Dict[str, List],
+    size: int,
+    extractions: Dict,
+) -> Tuple[List[int], List[Tuple]]:
+    # The rows where the extractors match and the conditions within the entity set
+    # hold, and their values for the conditions that join sources and targets
+    extractors = [
+        ei for ei, e in enumerate(rule["extractors"]) if e["entitySet"] == entity_set
+    ]
+    if not extractors:
+        return list(range(size)), [()] * size
+    groups_by_extractor = [
+        _extract(columns, rule["extractors"][ei], extractions) for ei in extractors
+    ]
+    position = {ei: k for k, ei in enumerate(extractors)}
+    joined, checks = [], []
+    for condition in rule["conditions"]:
+        arguments = [
+            (position[ei], gi) for ei, gi in condition["arguments"] if ei in position
+        ]
+        if arguments and len(arguments) < len(condition["arguments"]):
+            joined.append(arguments[0])
+        if len(arguments) > 1:
+            checks.append(arguments)
+
+    rows, keys = [], []
+    for row, groups in enumerate(zip(*groups_by_extractor)):
+        if None in groups or (
+            checks and any(_differ(groups, arguments) for arguments in checks)
+        ):
+            continue
+        rows.append(row)
+        keys.append(tuple([groups[k][gi] for k, gi in joined]))
+    return rows, keys
+
+
+def _differ(groups: Tuple, arguments: List[Tuple[int, int]]) -> bool:
+    return len({groups[k][gi] for k, gi in arguments}) > 1
+
+
+def _shard_keys(
+    rules: List[Dict], entity_set: str, columns: Dict[str, List], size: int
+) -> List[Tuple[np.ndarray, List[Tuple]]]:
+    # Runs in a worker process, on a shard of the entities
+    extractions = {}
+    result = []
+    for rule in rules:
+        rows, keys = _join_keys(rule, entity_set, columns, size, extractions)
+        result.append((np.array(rows, dtype=np.int64), keys))
+    return result
+
+
+def _all_keys(
+    rules: List[Dict], entity_set: str, entities: List[Dict], processes: int
+) -> List[Tuple[List[int], List[Tuple]]]:
+    # The join keys of every rule. With several processes, the entities are split into
+    # shards and only the fields the extractors use are sent to the workers.
+    if processes <= 1 or len(entities) < MIN_SHARD_SIZE:
+        columns, extractions = _Columns(entities), {}
+        return [
+            _join_keys(rule, entity_set, columns, len(entities), extractions)
+            for rule in rules
+        ]
+
+    fields = sorted(
+        {
+            e["field"]
+            for rule in rules
+            for e in rule["extractors"]
+            if e["entitySet"] == entity_set
+        }
+    )
+    shard_size = max(MIN_SHARD_SIZE, -(-len(entities) // (processes * 4)))
+    offsets = list(range(0, len(entities), shard_size))
+    shards = (
+        {f: [e.get(f) for e in entities[o : o + shard_size]] for f in fields}
+        for o in offsets
+    )
+    sizes = [min(shard_size, len(entities) - o) for o in offsets]
+    result = [([], []) for _ in rules]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        shard_results = executor.map(
+            _shard_keys, repeat(rules), repeat(entity_set), shards, sizes
+        )
+        for offset, shard_result in zip(offsets, shard_results):
+            for (rows, keys), (shard_rows, shard_keys) in zip(result, shard_result):
+                rows.extend((shard_rows + offset).tolist())
+                keys.extend(shard_keys)
+    return result
+
+
+def _join(
+    sources: Tuple[List[int], List[Tuple]], targets: Tuple[List[int], List[Tuple]]
+) -> List[Tuple[int, int]]:
+    # The (source row, target row) pairs with equal keys, joined through a hash index
+    # on the target keys
+    target_rows = {}
+    for row, key in zip(*targets):
+        target_rows.setdefault(key, []).append(row)
+    return [
+        (row, target_row)
+        for row, key in zip(*sources)
+        for target_row in target_rows.get(key, ())
+    ]
+
+
+def match_rule(
+    rule: Dict, sources: List[Dict], targets: List[Dict]
+) -> List[Tuple[int, int]]:
+    # The (source row, target row) pairs the rule matches
+    return _join(
+        _all_keys([rule], SOURCES, sources, 1)[0],
+        _all_keys([rule], TARGETS, targets, 1)[0],
+    )
+
+
+def apply_rules(
+    sources: List[Dict],
+    targets: List[Dict],
+    rules: List[Dict],
+    id_field: str = "id",
+    processes: int = 1,
+) -> Dict:
+    # Evaluates rules with regex extractors and equals conditions locally, and returns
+    # the same result as match_rules.apply. With more than one process, the regex
+    # extraction is spread over a process pool.
+    unsupported = [i for i, rule in enumerate(rules) if not is_supported(rule)]
+    if unsupported:
+        raise ValueError(f"Rules {unsupported} can not be applied locally")
+    source_keys = _all_keys(rules, SOURCES, sources, processes)
+    target_keys = _all_keys(rules, TARGETS, targets, processes)
+    items = []
+    match_tuples = []
+    for rule_sources, rule_targets in zip(source_keys, target_keys):
+        pairs = _join(rule_sources, rule_targets)
+        matches = [{"source": sources[i], "target": targets[j]} for i, j in pairs]
+        items.append({"matches": matches, "numberOfMatches": len(matches)})
+        match_tuples.append(
+            [(sources[i][id_field], targets[j][id_field]) for i, j in pairs]
+        )
+    for item, relations in zip(items, rule_relations(match_tuples)):
+        item.update(relations)
+    return {"items": items}
@@ -0,0 +1,205 @@
+import gzip
+import json
+import os
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from entity_store import EntityStore, int_array
+
+# Version 1: entity columns as .npy arrays or dictionary encoded, match lists and the
+# matches of each applied rule as arrays of (source id, target id)
+VERSION = 1
+MANIFEST = "manifest.json"
+
+
+def _write_json(path: str, value):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(value, f)
+
+
+def _read_json(path: str):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_column(directory: str, name: str, values: List) -> Dict:
+    # Integer columns are saved as they are. Other columns are saved as the distinct
+    # values and one integer code per entity, which is small for repeated values.
+    array = int_array(values) if values else None
+    if array is not None:
+        np.save(os.path.join(directory, name + ".npy"), array)
+        return {"kind": "int", "file": name + ".npy"}
+    # Keyed by type as well, since 1, 1.0 and True are equal as dict keys
+    codes, distinct = [], {}
+    for value in values:
+        codes.append(distinct.setdefault((type(value), value), len(distinct)))
+    np.save(os.path.join(directory, name + ".codes.npy"), np.array(codes, np.int32))
+    _write_json(
+        os.path.join(directory, name + ".values.json.gz"), [v for _, v in distinct]
+    )
+    return {
+        "kind": "dictionary",
+        "file": name + ".codes.npy",
+        "values": name + ".values.json.gz",
+    }
+
+
+def _column_loader(directory: str, column: Dict) -> Callable[[], List]:
+    # Columns are only read and decoded when the store first needs them. The store
+    # keeps its columns as lists, so the arrays are read into memory rather than mapped.
+    def load() -> List:
+        array = np.load(os.path.join(directory, column["file"]))
+        if column["kind"] == "int":
+            return array.tolist()
+        values = _read_json(os.path.join(directory, column["values"]))
+        return [values[code] for code in array.tolist()]
+
+    return load
+
+
+def _save_store(directory: str, store: EntityStore) -> Dict:
+    os.makedirs(directory, exist_ok=True)
+    columns = {
+        field: _save_column(directory, f"column{i}", store.column(field))
+        for i, field in enumerate(store.fields)
+    }
+    return {"size": len(store), "id_field": store.id_field, "columns": columns}
+
+
+def _load_store(directory: str, table: Dict) -> EntityStore:
+    return EntityStore.from_columns(
+        {
+            field: _column_loader(directory, column)
+            for field, column in table["columns"].items()
+        },
+        table["size"],
+        table["id_field"],
+    )
+
+
+def _save_pairs(directory: str, name: str, pairs: List[Tuple]) -> Dict:
+    os.makedirs(directory, exist_ok=True)
+    flat = [i for pair in pairs for i in pair]
+    array = int_array(flat) if flat else None
+    if array is not None:
+        np.save(os.path.join(directory, name + ".npy"), array.reshape(-1, 2))
+        return {"kind": "int", "file": name + ".npy"}
+    _write_json(os.path.join(directory, name + ".json.gz"), [list(p) for p in pairs])
+    return {"kind": "json", "file": name + ".json.gz"}
+
+
+def _load_pairs(directory: str, saved: Dict) -> List[Tuple]:
+    path = os.path.join(directory, saved["file"])
+    if saved["kind"] == "int":
+        return [tuple(pair) for pair in np.load(path).tolist()]
+    return [tuple(pair) for pair in _read_json(path)]
+
+
+def _load_pair_columns(directory: str, saved: Dict) -> Tuple:
+    # The source ids and the target ids. Integer pairs are kept as arrays, and the ids
+    # are looked up in the stores without being converted to Python ints.
+    path = os.path.join(directory, saved["file"])
+    if saved["kind"] == "int":
+        array = np.load(path)
+        return array[:, 0], array[:, 1]
+    pairs = _read_json(path)
+    return [p[0] for p in pairs], [p[1] for p in pairs]
+
+
+def save_session(helper, path: str):
+    # Saves the entities, match lists, rules and the cached apply results of a
+    # MatchRuleHelper to the directory `path`
+    os.makedirs(path, exist_ok=True)
+    rule_editor = helper.rule_editor
+    match_lists = {
+        name: _save_pairs(os.path.join(path, "match_lists"), f"list{i}", list(matches))
+        for i, (name, matches) in enumerate(helper.user_match_lists.items())
+    }
+    apply_cache = {
+        key: {
+            **_save_pairs(
+                os.path.join(path, "apply"),
+                key,
+                [
+                    (m["source"][helper.source_id], m["target"][helper.target_id])
+                    for m in item["matches"]
+                ],
+            ),
+            "numberOfMatches": item["numberOfMatches"],
+        }
+        for key, item in rule_editor.apply_cache.items()
+    }
+    manifest = {
+        "version": VERSION,
+        "project": helper.project,
+        "sources": _save_store(os.path.join(path, "sources"), helper.source_store),
+        "source_fields": helper.source_fields,
+        "targets": _save_store(os.path.join(path, "targets"), helper.target_store),
+        "target_fields": helper.target_fields,
+        "match_lists": match_lists,
+        "rules": rule_editor.rules,
+        "deleted_rules": rule_editor.deleted_rules,
+        "rule_status": rule_editor.status_by_rule,
+        "apply_cache": apply_cache,
+        "apply_cache_fingerprint": rule_editor.apply_cache_fingerprint,
+    }
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+
+
+def load_session(helper, path: str):
+    # Restores a session saved with save_session into a new MatchRuleHelper. The rules
+    # are only sent to match_rules.apply if the saved results do not match the entities.
+    with open(os.path.join(path, MANIFEST), "r") as f:
+        manifest = json.load(f)
+    if manifest["version"] != VERSION:
+        raise ValueError(f"Unsupported session version {manifest['version']}")
+
+    helper.set_source_store(
+        _load_store(os.path.join(path, "sources"), manifest["sources"])
+    )
+    helper.set_target_store(
+        _load_store(os.path.join(path, "targets"), manifest["targets"])
+    )
+    helper.set_source_fields(manifest["source_fields"])
+    helper.set_target_fields(manifest["target_fields"])
+    for name, saved in manifest["match_lists"].items():
+        pairs = _load_pairs(os.path.join(path, "match_lists"), saved)
+        if name in helper.user_match_lists:
+            for match in pairs:
+                helper.user_match_lists[name].add(match)
+        else:
+            helper.add_match_set(name, pairs)
+
+    rule_editor = helper.rule_editor
+    fingerprint = tuple(manifest["apply_cache_fingerprint"] or ())
+    if fingerprint == helper.entities_fingerprint():
+        sources, targets = helper.reduced_sources, helper.reduced_targets
+        for key, saved in manifest["apply_cache"].items():
+            source_ids, target_ids = _load_pair_columns(
+                os.path.join(path, "apply"), saved
+            )
+            source_rows = helper.source_store.index.rows(source_ids)
+            target_rows = helper.target_store.index.rows(target_ids)
+            matches = [
+                {"source": sources[i], "target": targets[j]}
+                for i, j in zip(source_rows.tolist(), target_rows.tolist())
+            ]
+            rule_editor.apply_cache[key] = {
+                "matches": matches,
+                "numberOfMatches": saved["numberOfMatches"],
+            }
+        rule_editor.apply_cache_fingerprint = fingerprint
+    for rule in manifest["rules"]:
+        rule_editor.add_rule(rule)
+    rule_editor.deleted_rules = manifest["deleted_rules"]
+    rule_editor.status_by_rule = manifest["rule_status"]
+    if not rule_editor.rules:
+        return
+    rule_editor.uncalculated_rules = True
+    cached = all(key in rule_editor.apply_cache for key in rule_editor.rule_keys)
+    if cached or helper.client is not None or helper.apply_locally:
+        rule_editor._apply_rules()
+    else:
+        rule_editor._notice_changes()
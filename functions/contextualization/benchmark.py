@@ -0,0 +1,102 @@
+"""Benchmark the contextualization function without a CDF project.
+
+Runs `handler.handle` against the in-process stand-in from `fake_client.py`, which serves the assets and time series from
+`publicdata.json` repeated `scale` times and simulates the latency of the API. Every scenario runs in a fresh process, so
+the reported peak memory belongs to that scenario only. For example:
+
+    python benchmark.py --scales 1 10 100 --modes batch streaming
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from typing import Dict
+
+from fake_client import FakeCogniteClient, Latency
+from handler import handle
+from timing import peak_rss_mb
+
+# The `data` given to the function in each scenario. Scenarios with a store run the function once before they are timed,
+# so the timed run can reuse the trained model or the incremental state.
+MODES = {
+    "batch": {},
+    "streaming": {"streaming": True},
+    "cached": {"cache": True},
+    "incremental": {"cache": True, "incremental": True},
+    "local_prepass": {"local_matcher": "prepass"},
+    "local_only": {"local_matcher": "only"},
+}
+
+
+def run_scenario(scale: int, mode: str, latencies: Dict[str, Dict], verbose: bool = False) -> Dict:
+    client = FakeCogniteClient(scale, **{name: Latency(**latency) for name, latency in latencies.items()})
+    data = dict(MODES[mode])
+    # The function prints its progress, which is hidden unless asked for to keep the result table readable
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(sys.stdout if verbose else io.StringIO()):
+        if data.pop("cache", False):
+            data["cache_path"] = os.path.join(tmp, "cache.json")
+            handle(client, data)
+        t0 = time.perf_counter()
+        response = handle(client, data)
+        seconds = time.perf_counter() - t0
+    return {
+        "scale": scale,
+        "mode": mode,
+        "assets": client.data.asset_count,
+        "time_series": client.data.time_series_count,
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "matches": response["matches"],
+        "fit_calls": client.entity_matching.fit_calls,
+        "timings": response["timings"],
+    }
+
+
+def run_isolated(*args) -> Dict:
+    # A new interpreter per scenario, as the peak memory of a process can not be reset
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_scenario, *args).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="Copies of the publicdata set")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--no-latency", action="store_true", help="Only measure the time spent in the function itself")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the function")
+    parser.add_argument("--json", help="Write the results, including the timings per stage, to this file")
+    args = parser.parse_args()
+
+    latencies = {
+        "list_latency": {"per_call": 0.05, "per_item": 5e-6},
+        "fit_latency": {"per_call": 2.0, "per_item": 1e-5},
+        "predict_latency": {"per_call": 1.0, "per_item": 2e-5},
+        "update_latency": {"per_call": 0.1, "per_item": 1e-5},
+    }
+    if args.no_latency:
+        latencies = {}
+
+    results = []
+    print(f"{'scale':>6} {'mode':>12} {'assets':>10} {'time series':>12} {'seconds':>9} {'peak MB':>8} {'matches':>9}")
+    for scale in args.scales:
+        for mode in args.modes:
+            result = run_isolated(scale, mode, latencies, args.verbose)
+            results.append(result)
+            print(
+                f"{scale:>6} {mode:>12} {result['assets']:>10} {result['time_series']:>12} "
+                f"{result['seconds']:>9.2f} {result['peak_rss_mb']:>8.1f} {result['matches']:>9}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
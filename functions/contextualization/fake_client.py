@@ -0,0 +1,203 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from cognite.client.data_classes import Asset, TimeSeries
+
+PUBLICDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "publicdata.json")
+# Time series names in publicdata are the asset tag with a prefix and suffix, e.g. VAL_23-PT-92523:X.Value
+_TOKENS = re.compile(r"[_:.]")
+
+
+class Latency:
+    # Simulated server-side latency. Each call waits `per_call` seconds plus `per_item` seconds for every item in it.
+    def __init__(self, per_call: float = 0.0, per_item: float = 0.0):
+        self.per_call = per_call
+        self.per_item = per_item
+
+    def wait(self, items: int = 0):
+        delay = self.per_call + self.per_item * items
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SyntheticData:
+    # The assets and time series from `publicdata.json`, repeated `scale` times. Copy k of every asset name gets a `-k<k>`
+    # suffix, and so does the asset tag in the names of the time series of the same copy, so they match each other.
+    # Resources are generated from their index when they are listed, so the stand-in itself uses little memory, also at
+    # millions of time series.
+    def __init__(self, scale: int = 1, path: str = PUBLICDATA):
+        with open(path, "r") as f:
+            data = json.load(f)
+        self.scale = scale
+        self.asset_names = [asset["name"] for asset in data["assets"]]
+        self.time_series_names = [ts["name"] for ts in data["time_series"]]
+        asset_names = set(self.asset_names)
+        self.time_series_tags = [
+            max((token for token in _TOKENS.split(name) if token in asset_names), key=len, default=None)
+            for name in self.time_series_names
+        ]
+        self.asset_count = len(self.asset_names) * scale
+        self.time_series_count = len(self.time_series_names) * scale
+        self.last_updated_time = {}
+
+    def asset(self, index: int) -> Asset:
+        copy, i = divmod(index, len(self.asset_names))
+        id = index + 1
+        name = self.asset_names[i] if copy == 0 else f"{self.asset_names[i]}-k{copy}"
+        return Asset(id=id, name=name, last_updated_time=self.last_updated_time.get(id, 0))
+
+    def time_series(self, index: int, asset_id: Optional[int] = None) -> TimeSeries:
+        copy, i = divmod(index, len(self.time_series_names))
+        id = self.asset_count + index + 1
+        name, tag = self.time_series_names[i], self.time_series_tags[i]
+        if copy > 0 and tag is not None:
+            name = name.replace(tag, f"{tag}-k{copy}", 1)
+        return TimeSeries(id=id, name=name, asset_id=asset_id, last_updated_time=self.last_updated_time.get(id, 0))
+
+
+class _ResourcesAPI:
+    def __init__(self, count: int, make, latency: Latency):
+        self._count = count
+        self._make = make
+        self._latency = latency
+
+    def _items(self, last_updated_time: Dict = None):
+        items = (self._make(i) for i in range(self._count))
+        if last_updated_time:
+            items = (item for item in items if item.last_updated_time >= last_updated_time.get("min", 0))
+        return items
+
+    def __call__(self, chunk_size: int = 1000, last_updated_time: Dict = None, **_):
+        # Yields pages of `chunk_size` resources, like the SDK does when `chunk_size` is given
+        page = []
+        for item in self._items(last_updated_time):
+            page.append(item)
+            if len(page) == chunk_size:
+                self._latency.wait(len(page))
+                yield page
+                page = []
+        if page:
+            self._latency.wait(len(page))
+            yield page
+
+    def list(self, limit: int = 25, partitions: int = None, last_updated_time: Dict = None, **_) -> List:
+        items = []
+        for item in self._items(last_updated_time):
+            if limit not in (-1, None) and len(items) >= limit:
+                break
+            items.append(item)
+        # Partitions are downloaded in parallel
+        self._latency.wait(len(items) / (partitions or 1))
+        return items
+
+
+class FakeAssetsAPI(_ResourcesAPI):
+    def __init__(self, data: SyntheticData, latency: Latency):
+        super().__init__(data.asset_count, data.asset, latency)
+
+
+class FakeTimeSeriesAPI(_ResourcesAPI):
+    def __init__(self, data: SyntheticData, latency: Latency, update_latency: Latency):
+        super().__init__(data.time_series_count, self._time_series, latency)
+        self._data = data
+        self._update_latency = update_latency
+        self._lock = threading.Lock()
+        self.asset_ids = {}
+        self.update_calls = 0
+
+    def _time_series(self, index: int) -> TimeSeries:
+        id = self._data.asset_count + index + 1
+        return self._data.time_series(index, self.asset_ids.get(id))
+
+    def retrieve_multiple(self, ids: List[int], ignore_unknown_ids: bool = False) -> List[TimeSeries]:
+        first = self._data.asset_count + 1
+        return [self._time_series(id - first) for id in ids if 0 <= id - first < self._data.time_series_count]
+
+    def update(self, items):
+        self._update_latency.wait(len(items))
+        now = int(time.time() * 1000)
+        with self._lock:
+            self.update_calls += 1
+            for item in items:
+                dumped = item.dump()
+                self.asset_ids[dumped["id"]] = dumped["update"]["assetId"]["set"]
+                self._data.last_updated_time[dumped["id"]] = now
+        # Like the SDK, the updated time series are returned
+        first = self._data.asset_count + 1
+        return [self._time_series(item.dump()["id"] - first) for item in items]
+
+
+class FakeJob:
+    def __init__(self, result: Dict):
+        self.result = result
+
+
+class FakeModel:
+    # Scores a time series 0.9 against assets whose name equals one of the tokens of the time series name, and 0.3
+    # against an arbitrary asset otherwise. That is enough to exercise the threshold, margin and update paths.
+    def __init__(self, id: int, targets: List[Dict], predict_latency: Latency):
+        self.id = id
+        self.status = "Completed"
+        self._predict_latency = predict_latency
+        self._targets_by_name = {}
+        for target in targets:
+            self._targets_by_name.setdefault(target["name"], []).append(target)
+        self._fallback = targets[:2]
+
+    def __str__(self):
+        return str(self.id)
+
+    def wait_for_completion(self):
+        pass
+
+    def predict(self, sources: List[Dict] = None, num_matches: int = 1, **_) -> FakeJob:
+        self._predict_latency.wait(len(sources))
+        items = []
+        for source in sources:
+            candidates = [
+                {"target": target, "score": 0.9}
+                for token in _TOKENS.split(source["name"] or "")
+                for target in self._targets_by_name.get(token, [])
+            ]
+            candidates += [{"target": target, "score": 0.3} for target in self._fallback]
+            items.append({"source": source, "matches": candidates[:num_matches]})
+        return FakeJob({"items": items})
+
+
+class FakeEntityMatchingAPI:
+    def __init__(self, fit_latency: Latency, predict_latency: Latency):
+        self._fit_latency = fit_latency
+        self._predict_latency = predict_latency
+        self._models = {}
+        self.fit_calls = 0
+
+    def fit(self, sources: List[Dict], targets: List[Dict], **_) -> FakeModel:
+        self._fit_latency.wait(len(sources) + len(targets))
+        self.fit_calls += 1
+        model = FakeModel(self.fit_calls, targets, self._predict_latency)
+        self._models[model.id] = model
+        return model
+
+    def retrieve(self, id: int) -> Optional[FakeModel]:
+        return self._models.get(id)
+
+
+class FakeCogniteClient:
+    # An in-process stand-in for the parts of the experimental CogniteClient that the handler uses, serving synthetic
+    # assets and time series and simulating the latency of listing, fitting, predicting and updating
+    def __init__(
+        self,
+        scale: int = 1,
+        list_latency: Latency = None,
+        fit_latency: Latency = None,
+        predict_latency: Latency = None,
+        update_latency: Latency = None,
+    ):
+        self.data = SyntheticData(scale)
+        self.assets = FakeAssetsAPI(self.data, list_latency or Latency())
+        self.time_series = FakeTimeSeriesAPI(self.data, list_latency or Latency(), update_latency or Latency())
+        self.entity_matching = FakeEntityMatchingAPI(fit_latency or Latency(), predict_latency or Latency())
@@ -1,53 +1,153 @@
+from incremental import assets_changed, changed_time_series, empty_state, latest_update, load_state, next_state, save_state
+from lexical_matcher import LOCAL_ONLY, LexicalMatcher, match_locally
+from matches import select_updates
+from model_cache import fit_or_reuse, get_store
+from predict import chunks, predict_concurrently
+from streaming import run_streaming
+from timing import StageTimer
+from writer import TimeSeriesUpdateWriter
+
+
 def handle(client, data):
-    # When deploying a function from a notebook like this, all imports must be performed inside the `handle` function.
+    # The function is deployed from this folder, so the sibling modules imported at the top of this file are available.
+    # The SDK clients are still imported here, as in the notebook version of this function.
+    from cognite.client import CogniteClient as BaseCogniteClient
     from cognite.experimental import CogniteClient
-    from cognite.client.data_classes import TimeSeriesUpdate
-    import time
     
     # The entity matcher suggests matches with a certain score. To achieve a reasonable result, this score must be adjusted. 
     # The default value of 0.75 has been chosen by inspecting the outcome of this function, and may be different on data from other customers.
     good_match_threshold = data.get("good_match_threshold", 0.75)
+    # Optionally require the best match to score this much higher than the second best, to avoid links to one of several similar assets
+    min_margin = data.get("min_margin", 0.0)
+    num_matches = 2 if min_margin > 0 else 1
     
     # Create experimental SDK client as the contextualization API's are in playground and are thus not available in the regular SDK.
-    client = CogniteClient(api_key = client.config.api_key, base_url = client.config.base_url, project = client.config.project)
+    # Other clients, like the stand-in used by benchmark.py, are used as they are.
+    if isinstance(client, BaseCogniteClient):
+        client = CogniteClient(api_key = client.config.api_key, base_url = client.config.base_url, project = client.config.project)
+
+    # Wall time, item counts and memory per stage are returned with the result, and optionally logged as one JSON line
+    timer = StageTimer()
+
+    # Trained models are registered by a fingerprint of the assets, so they can be reused when the assets have not changed
+    store = get_store(client, data)
 
-    # Download all assets and time series, using 5 requests in parallel
-    assets = client.assets.list(limit=-1, partitions=5)
-    time_series = client.time_series.list(limit=-1, partitions=5)
+    # On large tenants, process the time series page by page instead of loading everything into memory.
+    # Peak memory then depends on `chunk_size` rather than on the number of time series in the tenant.
+    if data.get("streaming", False):
+        response = run_streaming(
+            client,
+            good_match_threshold,
+            chunk_size = data.get("chunk_size", 1000),
+            prefetch_pages = data.get("prefetch_pages", 2),
+            max_in_flight_predicts = data.get("max_in_flight_predicts", 4),
+            max_in_flight_updates = data.get("max_in_flight_updates", 4),
+            min_margin = min_margin,
+            local_matcher = data.get("local_matcher"),
+            local_match_threshold = data.get("local_match_threshold", 0.5),
+            store = store,
+            timer = timer,
+        )
+        print(f"Matched {response['matches']} time series to assets, updates: {response['updates']}")
+        return _with_timings(response, timer, data)
+
+    # In incremental mode, only new, changed and still unmatched time series are predicted. The state from the previous run
+    # is kept in the store, and `full_rebuild` ignores it and matches everything again.
+    incremental = data.get("incremental", False)
+    state = None
+    if incremental:
+        if store is None:
+            raise ValueError("Incremental mode needs cache_db and cache_table, or cache_path, to keep its state between runs")
+        if not data.get("full_rebuild", False):
+            state = load_state(store)
+
+    if state is None:
+        # Download all assets and time series, using 5 requests in parallel
+        with timer.stage("list"):
+            assets = client.assets.list(limit=-1, partitions=5)
+            time_series = client.time_series.list(limit=-1, partitions=5)
+        listed_time = latest_update(time_series)
+        if incremental:
+            state = empty_state(store)
+    else:
+        with timer.stage("list"):
+            time_series, listed_time = changed_time_series(client, state, retry_unmatched = assets_changed(client, state))
+        if len(time_series) == 0:
+            print("No new or changed time series since the last run")
+            save_state(store, next_state(state, listed_time, 0, [], [], {}))
+            return _with_timings({
+                "matches": 0,
+                "updates": {"applied": 0, "skipped": 0, "failed": 0}
+            }, timer, data)
+        with timer.stage("list"):
+            assets = client.assets.list(limit=-1, partitions=5)
+        print(f"Found {len(time_series)} new, changed or unmatched time series since the last run")
+    timer.count("list", len(assets) + len(time_series))
     
     # Create simplified objects with only name and id
-    assets_simplified = [{"id": asset.id, "name": asset.name} for asset in assets]
-    time_series_simplified = [{"id": ts.id, "name": ts.name} for ts in time_series]
-
-    # Train the ML Entity Matcher on the data. The SDK expects as input the array of objects you match FROM (time series) and a list of what you match TO (assets)
-    t0 = time.time()
-    model = client.entity_matching.fit(sources = time_series_simplified, targets = assets_simplified)
-    print(f"Training entity matcher model with id {model} ...")
-    model.wait_for_completion()
-    t1 = time.time()
-    print(f"Model {model} trained on {len(assets_simplified)} assets and {len(time_series_simplified)} time series using {t1-t0} seconds")
-
-    # Use the ML Entity Matcher model to match the data. This model can be reused, so training is not necessary each time, but we do it for simplicity in this example.
-    t0 = time.time()
-    job = model.predict(time_series_simplified)
-    result = job.result # This will wait for completion
-    t1 = time.time()
-    print(f"Predict finished after {t1-t0} seconds on {len(time_series_simplified)} time series.")
-    
-    # Filter out the best matches with the threshold specified in the input
-    good_match_count = 0
+    with timer.stage("simplify", len(assets) + len(time_series)):
+        assets_simplified = [{"id": asset.id, "name": asset.name} for asset in assets]
+        time_series_simplified = [{"id": ts.id, "name": ts.name} for ts in time_series]
+
+    # The writer sends the updates in batches in the background, retries throttled batches and counts what was applied
+    writer = TimeSeriesUpdateWriter(client, max_in_flight = data.get("max_in_flight_updates", 4), track_written = incremental)
     time_series_updates = []
-    for item in result["items"]:
-        match_from = item["source"] # Time series
-        matches = item["matches"] # Suggested asset matches for the time series
-        good_matches = [match for match in matches if match["score"] >= good_match_threshold]
-        if len(good_matches) > 0:
-            good_match_count += 1
-            best_match = good_matches[0]
-            time_series_updates.append(TimeSeriesUpdate(id=match_from["id"]).asset_id.set(best_match["target"]["id"]))
+
+    # Names that contain the name of an asset can be matched locally in milliseconds. As a pre-pass, only the time series the
+    # local matcher is confident about are matched locally, and the rest is sent to the entity matcher.
+    local_matcher = data.get("local_matcher")
+    remote_time_series = time_series_simplified
+    if local_matcher:
+        with timer.stage("local_match", len(time_series_simplified)):
+            matcher = LexicalMatcher(assets_simplified, fuzzy = local_matcher == LOCAL_ONLY)
+            threshold = good_match_threshold if local_matcher == LOCAL_ONLY else data.get("local_match_threshold", 0.5)
+            local_updates, remote_time_series = match_locally(matcher, time_series_simplified, threshold, min_margin)
+        if local_matcher == LOCAL_ONLY:
+            remote_time_series = []
+        with timer.stage("update", len(local_updates)):
+            writer.write(local_updates)
+        time_series_updates.extend(local_updates)
+        print(f"Matched {len(local_updates)} time series locally, {len(remote_time_series)} are left for the entity matcher")
+
+    if remote_time_series:
+        # Train the ML Entity Matcher on the data. The SDK expects as input the array of objects you match FROM (time series) and a list of what you match TO (assets)
+        with timer.stage("fit", len(assets_simplified) + len(remote_time_series)):
+            model = fit_or_reuse(client, remote_time_series, assets_simplified, store)
+            print(f"Waiting for entity matcher model with id {model} ...")
+            model.wait_for_completion()
+        print(f"Model {model} trained on {len(assets_simplified)} assets and {len(remote_time_series)} time series using {timer.stages['fit']['seconds']} seconds")
+
+        # Use the ML Entity Matcher model to match the data. If a store is configured, the model is only retrained when the assets change.
+        # The time series are predicted in chunks, with several predict jobs running at the same time. The matches of each chunk are
+        # applied as soon as it is done, so scoring overlaps with updates and the progress is kept if the function times out.
+        predict_chunks = chunks(remote_time_series, data.get("predict_chunk_size", 10000))
+        max_in_flight_predicts = data.get("max_in_flight_predicts", 4)
+        predictions = predict_concurrently(model, predict_chunks, max_in_flight = max_in_flight_predicts, num_matches = num_matches)
+        for items in timer.timed_iter("predict", predictions):
+            # Filter out the best matches with the threshold specified in the input
+            with timer.stage("filter", len(items)):
+                chunk_updates = select_updates(items, good_match_threshold, min_margin)
+            with timer.stage("update", len(chunk_updates)):
+                writer.write(chunk_updates) # remove to only count the matches without updating the asset_id field
+            time_series_updates.extend(chunk_updates)
+    with timer.stage("update"):
+        writer.close()
+    good_match_count = len(time_series_updates)
     
-    client.time_series.update(time_series_updates) # uncomment to actually update the asset_id field
-    print(f"Matched {good_match_count} time series to assets")
-    return {
-        "matches": good_match_count
-    }
+    if incremental:
+        failed_ids = set(writer.failed_ids)
+        matched_ids = [update.dump()["id"] for update in time_series_updates]
+        matched_ids = [id for id in matched_ids if id not in failed_ids]
+        save_state(store, next_state(state, listed_time, latest_update(assets), time_series, matched_ids, writer.written))
+    print(f"Matched {good_match_count} time series to assets, updates: {writer.counts()}")
+    return _with_timings({
+        "matches": good_match_count,
+        "updates": writer.counts()
+    }, timer, data)
+
+
+def _with_timings(response, timer, data):
+    # Set `log_timings` to also print the timings as one JSON line, to track performance from one scheduled run to the next
+    if data.get("log_timings", False):
+        timer.log(**response)
+    return {**response, "timings": timer.report()}
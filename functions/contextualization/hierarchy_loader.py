@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set
+
+from cognite.client.data_classes import Asset
+from cognite.client.exceptions import CogniteDuplicatedError
+
+# The maximum number of assets in one create request
+ITEM_LIMIT = 1000
+
+
+def depth_levels(assets: List[Asset], allow_orphans: bool = False) -> List[List[Asset]]:
+    # Sort the assets into levels by depth in one pass over the hierarchy, so every asset comes after its parent.
+    # Orphans are assets whose parent is not among the assets. With `allow_orphans` they are placed at the top level, which
+    # works when their parents already exist in the project, for instance when loading a subtree.
+    by_external_id = {asset.external_id: asset for asset in assets}
+    if len(by_external_id) != len(assets):
+        raise ValueError("The external ids of the assets are not unique")
+
+    children = {}
+    level = []
+    orphans = []
+    for asset in assets:
+        parent = asset.parent_external_id
+        if parent is None:
+            level.append(asset)
+        elif parent in by_external_id:
+            children.setdefault(parent, []).append(asset)
+        else:
+            orphans.append(asset)
+    if orphans and not allow_orphans:
+        raise ValueError(
+            f"{len(orphans)} assets have a parent that is not among the assets, "
+            f"for instance {[asset.external_id for asset in orphans[:10]]}"
+        )
+    level.extend(orphans)
+
+    levels = []
+    while level:
+        levels.append(level)
+        level = [child for asset in level for child in children.get(asset.external_id, [])]
+
+    # Assets that can not be reached from a root or an orphan have an ancestor that is its own ancestor
+    placed = sum(len(level) for level in levels)
+    if placed != len(assets):
+        reached = {asset.external_id for level in levels for asset in level}
+        in_cycles = [asset.external_id for asset in assets if asset.external_id not in reached]
+        raise ValueError(f"{len(in_cycles)} assets are part of a cycle, for instance {in_cycles[:10]}")
+    return levels
+
+
+class Checkpoint:
+    # Records the external ids of created assets, one line per created chunk, so a load that stops can be resumed
+    # without creating assets twice. `added` holds the ones recorded since the checkpoint was opened.
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.created = set()
+        self.added = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    self.created.update(json.loads(line))
+
+    def add(self, external_ids: List):
+        with self._lock:
+            self.created.update(external_ids)
+            self.added.update(external_ids)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(external_ids) + "\n")
+
+
+def _create_chunk(client, chunk: List[Asset], checkpoint: Checkpoint):
+    try:
+        client.assets.create(chunk)
+    except CogniteDuplicatedError as e:
+        # Created by an earlier load that stopped before it was recorded. Create the rest and record all of them.
+        duplicated = {str(item.get("externalId")) for item in e.duplicated}
+        remaining = [asset for asset in chunk if str(asset.external_id) not in duplicated]
+        if remaining:
+            client.assets.create(remaining)
+    checkpoint.add([asset.external_id for asset in chunk])
+
+
+def create_hierarchy(
+    client,
+    assets: List[Asset],
+    chunk_size: int = ITEM_LIMIT,
+    max_workers: int = 5,
+    checkpoint_path: Optional[str] = None,
+    allow_orphans: bool = False,
+) -> Set:
+    # Create the assets level by level. Within a level the parents already exist, so the level is split into chunks that
+    # are created in parallel. With `checkpoint_path`, assets created by an earlier call are skipped. Returns the external
+    # ids of the assets created by this call.
+    checkpoint = Checkpoint(checkpoint_path)
+    levels = depth_levels(assets, allow_orphans=allow_orphans)
+    size = min(chunk_size, ITEM_LIMIT)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for depth, level in enumerate(levels):
+            level = [asset for asset in level if asset.external_id not in checkpoint.created]
+            if not level:
+                continue
+            print(f"Creating {len(level)} assets for depth {depth}")
+            chunks = [level[i : i + size] for i in range(0, len(level), size)]
+            # Wait for the whole level, so all parents exist before their children are created
+            for future in [executor.submit(_create_chunk, client, chunk, checkpoint) for chunk in chunks]:
+                future.result()
+    return checkpoint.added
@@ -0,0 +1,117 @@
+from typing import Dict, List, Optional, Tuple
+
+STATE_KEY = "incremental-state"
+# The unmatched ids and the written time series are kept in several rows, since one raw row can not hold millions of
+# them. 20000 ids of up to 16 digits stay well below the size limit of a row, and a written time series takes two numbers.
+SHARD_SIZE = 20000
+UNMATCHED = "unmatched"
+WRITTEN = "written"
+
+
+def _shard_key(name: str, generation: int, shard: int) -> str:
+    return f"{STATE_KEY}-{name}-{generation}-{shard}"
+
+
+def _load_shards(store, name: str, generation: int, shards: int) -> List:
+    items = []
+    for shard in range(shards):
+        items.extend(store.get(_shard_key(name, generation, shard))["items"])
+    return items
+
+
+def _save_shards(store, name: str, generation: int, items: List, size: int) -> int:
+    starts = range(0, len(items), size)
+    for shard, start in enumerate(starts):
+        store.set(_shard_key(name, generation, shard), {"items": items[start : start + size]})
+    return len(starts)
+
+
+def latest_update(resources) -> int:
+    return max((r.last_updated_time or 0 for r in resources), default=0)
+
+
+def empty_state(store) -> Dict:
+    # The state of a first run or a full rebuild. The generation in use is kept, so the new shards do not overwrite the
+    # ones the head row still points to.
+    head = store.get(STATE_KEY) or {}
+    return {
+        "watermark": 0,
+        "asset_watermark": 0,
+        "unmatched_ids": set(),
+        "written": {},
+        "generation": head.get("generation", 1),
+        "shards": {},
+    }
+
+
+def load_state(store) -> Optional[Dict]:
+    head = store.get(STATE_KEY)
+    if head is None or "asset_watermark" not in head:
+        # Nothing saved yet, or saved in an older format, which is rebuilt by a full run
+        return None
+    generation, shards = head["generation"], head["shards"]
+    written = _load_shards(store, WRITTEN, generation, shards[WRITTEN])
+    return {
+        "watermark": head["watermark"],
+        "asset_watermark": head["asset_watermark"],
+        "unmatched_ids": set(_load_shards(store, UNMATCHED, generation, shards[UNMATCHED])),
+        "written": {id: last_updated_time for id, last_updated_time in written},
+        "generation": generation,
+        "shards": shards,
+    }
+
+
+def save_state(store, state: Dict):
+    # The shards are written under the generation that is not in use, and the head row is switched to it last, so a run
+    # that stops halfway leaves the previous state intact. If the shards did not change, only the head is written.
+    if state.get("changed", True):
+        generation = 1 - state["generation"]
+        shards = {
+            UNMATCHED: _save_shards(store, UNMATCHED, generation, sorted(state["unmatched_ids"]), SHARD_SIZE),
+            WRITTEN: _save_shards(store, WRITTEN, generation, sorted(state["written"].items()), SHARD_SIZE // 2),
+        }
+    else:
+        generation, shards = state["generation"], state["shards"]
+    store.set(STATE_KEY, {
+        "watermark": state["watermark"],
+        "asset_watermark": state["asset_watermark"],
+        "generation": generation,
+        "shards": shards,
+    })
+
+
+def assets_changed(client, state: Dict) -> bool:
+    return len(client.assets.list(last_updated_time={"min": state["asset_watermark"] + 1}, limit=1)) > 0
+
+
+def changed_time_series(client, state: Dict, retry_unmatched: bool) -> Tuple[List, int]:
+    # New and changed time series, and the latest lastUpdatedTime among them. The asset_id updates of the previous run
+    # are listed too, and skipped if the time series has not changed since, that is if it still has the lastUpdatedTime
+    # our update gave it.
+    listed = client.time_series.list(last_updated_time={"min": state["watermark"] + 1}, limit=-1, partitions=5)
+    written = state["written"]
+    time_series = [ts for ts in listed if written.get(ts.id) != ts.last_updated_time]
+    # Time series that did not get a good match can only get one if the assets have changed
+    if retry_unmatched:
+        seen = {ts.id for ts in time_series}
+        retry_ids = [id for id in state["unmatched_ids"] if id not in seen]
+        if retry_ids:
+            time_series.extend(client.time_series.retrieve_multiple(ids=retry_ids, ignore_unknown_ids=True))
+    return time_series, latest_update(listed)
+
+
+def next_state(state: Dict, listed_time: int, asset_time: int, time_series, matched_ids, written: Dict) -> Dict:
+    # `listed_time` and `asset_time` are the latest lastUpdatedTime among the listed time series and assets, so nothing
+    # that changed after the listing is skipped. `written` holds the lastUpdatedTime of each time series this run updated.
+    matched_ids = set(matched_ids)
+    predicted_ids = {ts.id for ts in time_series}
+    unmatched_ids = (state["unmatched_ids"] - predicted_ids) | (predicted_ids - matched_ids)
+    return {
+        "watermark": max(state["watermark"], listed_time),
+        "asset_watermark": max(state["asset_watermark"], asset_time),
+        "unmatched_ids": unmatched_ids,
+        "written": written,
+        "changed": unmatched_ids != state["unmatched_ids"] or written != state["written"],
+        "generation": state["generation"],
+        "shards": state["shards"],
+    }
@@ -0,0 +1,114 @@
+import math
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from cognite.client.data_classes import TimeSeriesUpdate
+
+from matches import select_updates
+
+# Values of `local_matcher` in the function data. With a pre-pass, the local matcher resolves the easy matches and the rest
+# is sent to the entity matching API. Otherwise the local matcher is used on its own.
+LOCAL_PREPASS = "prepass"
+LOCAL_ONLY = "only"
+
+_SEPARATORS = re.compile(r"[^0-9A-Z]+")
+
+
+def tokenize(name: Optional[str]) -> List[str]:
+    # Upper case alphanumeric tokens, so 23-PT-92537, 23_PT_92537 and 23pt92537 are all written the same way once joined
+    return [token for token in _SEPARATORS.split((name or "").upper()) if token]
+
+
+def ngrams(text: str, n: int) -> List[str]:
+    return [text[i : i + n] for i in range(max(len(text) - n + 1, 1))]
+
+
+class LexicalMatcher:
+    # A local entity matcher for names that contain the name of their target, like the asset 23-TE-96116-04 and the time
+    # series VAL_23-TE-96116-04:X.Value. Every run of consecutive tokens in a source name is looked up in an index of the
+    # target names with the separators removed, which finds exact matches in milliseconds. A match is scored by the
+    # fraction of the alphanumeric characters of the source name it covers, so a short generic name like PUMP scores low
+    # in PUMP_OUTLET_PRESSURE.
+    #
+    # With `fuzzy`, sources without an exact match are scored against all targets by TF-IDF weighted character n-grams.
+    # Predict returns the same format as the entity matching API, so it can replace it or resolve the easy matches before
+    # the rest is sent to it.
+    def __init__(self, targets: List[Dict], fuzzy: bool = True, ngram: int = 3, min_exact_length: int = 4):
+        self.fuzzy = fuzzy
+        self.ngram = ngram
+        self.min_exact_length = min_exact_length
+        self.targets = targets
+        self.targets_by_key = defaultdict(list)
+        self.max_tokens = 1
+        for i, target in enumerate(targets):
+            tokens = tokenize(target["name"])
+            self.targets_by_key["".join(tokens)].append(i)
+            self.max_tokens = max(self.max_tokens, len(tokens))
+        self._ngram_index = None
+
+    def _build_ngram_index(self):
+        postings = defaultdict(list)
+        for i, target in enumerate(self.targets):
+            for gram in set(ngrams("".join(tokenize(target["name"])), self.ngram)):
+                postings[gram].append(i)
+        self._idf = {gram: math.log(len(self.targets) / len(ids)) + 1 for gram, ids in postings.items()}
+        self._norms = [0.0] * len(self.targets)
+        for gram, ids in postings.items():
+            for i in ids:
+                self._norms[i] += self._idf[gram] ** 2
+        self._norms = [math.sqrt(norm) for norm in self._norms]
+        self._ngram_index = postings
+
+    def _exact(self, tokens: List[str]) -> List[Tuple[int, float]]:
+        size = sum(len(token) for token in tokens)
+        found = {}
+        for start in range(len(tokens)):
+            key = ""
+            for end in range(start, min(start + self.max_tokens, len(tokens))):
+                key += tokens[end]
+                if len(key) >= self.min_exact_length:
+                    for i in self.targets_by_key.get(key, []):
+                        found[i] = max(found.get(i, 0), len(key))
+        return [(i, length / size) for i, length in found.items()]
+
+    def _fuzzy(self, tokens: List[str]) -> List[Tuple[int, float]]:
+        if self._ngram_index is None:
+            self._build_ngram_index()
+        grams = [gram for gram in set(ngrams("".join(tokens), self.ngram)) if gram in self._idf]
+        if not grams:
+            return []
+        norm = math.sqrt(sum(self._idf[gram] ** 2 for gram in grams))
+        dot = defaultdict(float)
+        for gram in grams:
+            weight = self._idf[gram] ** 2
+            for i in self._ngram_index[gram]:
+                dot[i] += weight
+        return [(i, value / (norm * self._norms[i])) for i, value in dot.items()]
+
+    def predict(self, sources: List[Dict], num_matches: int = 1) -> Dict:
+        items = []
+        for source in sources:
+            tokens = tokenize(source["name"])
+            scored = self._exact(tokens)
+            if not scored and self.fuzzy:
+                scored = self._fuzzy(tokens)
+            best = sorted(scored, key=lambda match: -match[1])[:num_matches]
+            items.append(
+                {"source": source, "matches": [{"target": self.targets[i], "score": score} for i, score in best]}
+            )
+        return {"items": items}
+
+
+def match_locally(
+    matcher: LexicalMatcher, sources: List[Dict], threshold: float, min_margin: float = 0.0
+) -> Tuple[List[TimeSeriesUpdate], List[Dict]]:
+    # Returns the updates for the sources the local matcher is confident about, and the sources that are left. Sources
+    # where several targets share the best score, like two assets with the same name, are left for the entity matcher.
+    items = [
+        item for item in matcher.predict(sources, num_matches=2)["items"]
+        if len(item["matches"]) < 2 or item["matches"][0]["score"] > item["matches"][1]["score"]
+    ]
+    updates = select_updates(items, threshold, min_margin)
+    matched_ids = {update.dump()["id"] for update in updates}
+    return updates, [source for source in sources if source["id"] not in matched_ids]
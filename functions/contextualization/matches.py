@@ -0,0 +1,48 @@
+from typing import Dict, List
+
+import numpy as np
+from cognite.client.data_classes import TimeSeriesUpdate
+
+
+def to_columns(items: List[Dict]) -> Dict[str, np.ndarray]:
+    # Turn the predict output into one row per suggested match. The rank is the position of the match among the
+    # suggestions for its source, which the entity matcher returns with the best match first.
+    counts = np.fromiter((len(item["matches"]) for item in items), dtype=np.int64, count=len(items))
+    total = int(counts.sum())
+    source_ids = np.fromiter((item["source"]["id"] for item in items), dtype=np.int64, count=len(items))
+    return {
+        "source_id": np.repeat(source_ids, counts),
+        "target_id": np.fromiter(
+            (match["target"]["id"] for item in items for match in item["matches"]), dtype=np.int64, count=total
+        ),
+        "score": np.fromiter(
+            (match["score"] for item in items for match in item["matches"]), dtype=np.float64, count=total
+        ),
+        "rank": np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts),
+    }
+
+
+def filter_matches(
+    columns: Dict[str, np.ndarray], threshold: float, top_k: int = 1, min_margin: float = 0.0
+) -> Dict[str, np.ndarray]:
+    # Keep the `top_k` best matches per source with a score of at least `threshold`, for the sources where the best match
+    # scores at least `min_margin` higher than the second best. A margin makes it less likely to link a time series to
+    # one of several assets with almost the same name.
+    score, rank = columns["score"], columns["rank"]
+    first = rank == 0
+    second_score = np.zeros(len(score))
+    seconds = np.flatnonzero(rank == 1)
+    second_score[seconds - 1] = score[seconds]  # The second best match directly follows the best one
+    clear_winner = (score - second_score)[first] >= min_margin
+    source_index = np.cumsum(first) - 1
+    keep = (score >= threshold) & (rank < top_k) & clear_winner[source_index]
+    return {name: column[keep] for name, column in columns.items()}
+
+
+def select_updates(items: List[Dict], good_match_threshold: float, min_margin: float = 0.0) -> List[TimeSeriesUpdate]:
+    # Filter out the best matches with the threshold specified in the input
+    best = filter_matches(to_columns(items), good_match_threshold, top_k=1, min_margin=min_margin)
+    return [
+        TimeSeriesUpdate(id=source_id).asset_id.set(target_id)
+        for source_id, target_id in zip(best["source_id"].tolist(), best["target_id"].tolist())
+    ]
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+from cognite.client.exceptions import CogniteAPIError
+
+FAILED = "Failed"
+
+
+class LocalFileStore:
+    # Keeps values in a JSON file. Useful when running the handler locally, as the file system of a deployed function is
+    # not kept between calls.
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self._read().get(key)
+
+    def set(self, key: str, value: Dict):
+        values = self._read()
+        values[key] = value
+        with open(self.path, "w") as f:
+            json.dump(values, f)
+
+
+class RawStore:
+    # Keeps values as rows in a CDF raw table, so they survive between scheduled calls of a deployed function
+    def __init__(self, client, db_name: str, table_name: str):
+        self.client = client
+        self.db_name = db_name
+        self.table_name = table_name
+
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            row = self.client.raw.rows.retrieve(self.db_name, self.table_name, key)
+        except CogniteAPIError as e:
+            if e.code == 404:
+                return None
+            raise
+        return row.columns if row is not None else None
+
+    def set(self, key: str, value: Dict):
+        self.client.raw.rows.insert(self.db_name, self.table_name, {key: value}, ensure_parent=True)
+
+
+def get_store(client, data: Dict):
+    # A raw table is preferred, since it also works for the deployed function. Returns None if nothing is configured.
+    if data.get("cache_db") and data.get("cache_table"):
+        return RawStore(client, data["cache_db"], data["cache_table"])
+    if data.get("cache_path"):
+        return LocalFileStore(data["cache_path"])
+    return None
+
+
+def fingerprint(entities: List[Dict]) -> str:
+    # Sorting makes the fingerprint independent of the order the API happens to return the items in
+    sha = hashlib.sha256()
+    for id, name in sorted((e["id"], e["name"] or "") for e in entities):
+        sha.update(f"{id}\t{name}\n".encode())
+    return sha.hexdigest()
+
+
+def fit_or_reuse(client, sources: List[Dict], targets: List[Dict], store=None):
+    # The unsupervised model is trained on a sample of the sources, and any sample from the same tenant does, so a model is
+    # reused as long as the targets are the same. Incremental and streaming runs train on different sources every time.
+    if store is None:
+        return client.entity_matching.fit(sources=sources, targets=targets)
+
+    key = "model-" + fingerprint(targets)
+    cached = store.get(key)
+    if cached is not None:
+        model = _retrieve_model(client, cached["model_id"])
+        if model is not None and model.status != FAILED:
+            print(f"Reusing entity matcher model with id {model.id}, the assets have not changed")
+            return model
+
+    model = client.entity_matching.fit(sources=sources, targets=targets)
+    store.set(key, {"model_id": model.id})
+    return model
+
+
+def _retrieve_model(client, model_id: int):
+    try:
+        return client.entity_matching.retrieve(id=model_id)
+    except CogniteAPIError as e:
+        if e.code in (400, 404):  # The model has been deleted
+            return None
+        raise
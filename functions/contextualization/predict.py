@@ -0,0 +1,29 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Dict, Iterable, Iterator, List
+
+
+def chunks(items: List, chunk_size: int) -> Iterator[List]:
+    for i in range(0, len(items), chunk_size):
+        yield items[i : i + chunk_size]
+
+
+def _predict(model, sources: List[Dict], num_matches: int) -> List[Dict]:
+    return model.predict(sources=sources, num_matches=num_matches).result["items"]  # This will wait for completion
+
+
+def predict_concurrently(
+    model, source_chunks: Iterable[List[Dict]], max_in_flight: int = 4, num_matches: int = 1
+) -> Iterator[List[Dict]]:
+    # Submit one predict job per chunk, with at most `max_in_flight` jobs running at the same time, and yield the result
+    # items of each chunk as soon as it completes. This lets the caller filter and update the matches of one chunk while
+    # the next ones are scored, and keeps the work done so far if the function times out.
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight = set()
+        for chunk in source_chunks:
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            in_flight.add(executor.submit(_predict, model, chunk, num_matches))
+        for future in as_completed(in_flight):
+            yield future.result()
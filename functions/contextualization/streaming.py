@@ -0,0 +1,143 @@
+import itertools
+import queue
+import threading
+from typing import Dict, Iterable, Iterator, List
+
+from lexical_matcher import LOCAL_ONLY, LexicalMatcher, match_locally
+from matches import select_updates
+from model_cache import fit_or_reuse
+from predict import predict_concurrently
+from timing import StageTimer
+from writer import TimeSeriesUpdateWriter
+
+_DONE = object()
+
+
+def simplify(resources) -> List[Dict]:
+    # Keep only what the entity matcher needs, so the full SDK objects can be garbage collected right away
+    return [{"id": r.id, "name": r.name} for r in resources]
+
+
+def iter_simplified(pages: Iterable, timer: StageTimer) -> Iterator[List[Dict]]:
+    for page in timer.timed_iter("list", pages):
+        with timer.stage("simplify", len(page)):
+            simplified = simplify(page)
+        yield simplified
+
+
+def prefetch(pages: Iterable, depth: int = 2) -> Iterator:
+    # Download pages on a background thread, so the next pages are on their way while the current one is processed.
+    # The queue is bounded, so at most `depth` pages are held in memory ahead of the consumer.
+    buffer = queue.Queue(maxsize=depth)
+    # Set when the consumer raises or stops early, so the producer does not wait forever for room in the queue
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+        except Exception as e:
+            put(e)
+        put(_DONE)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            page = buffer.get()
+            if page is _DONE:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        stopped.set()
+
+
+def _counted(pages: Iterable[List], counts: Dict, key: str) -> Iterator[List]:
+    for page in pages:
+        counts[key] += len(page)
+        yield page
+
+
+def _match_pages_locally(pages, matcher, threshold, min_margin, writer, timer, counts) -> Iterator[List[Dict]]:
+    # Resolve the easy matches of each page locally, and pass on the time series that are left
+    for page in pages:
+        with timer.stage("local_match", len(page)):
+            local_updates, page = match_locally(matcher, page, threshold, min_margin)
+        counts["matches"] += len(local_updates)
+        with timer.stage("update", len(local_updates)):
+            writer.write(local_updates)
+        if page:
+            yield page
+
+
+def run_streaming(
+    client,
+    good_match_threshold: float,
+    chunk_size: int = 1000,
+    prefetch_pages: int = 2,
+    max_in_flight_predicts: int = 4,
+    max_in_flight_updates: int = 4,
+    min_margin: float = 0.0,
+    local_matcher: str = None,
+    local_match_threshold: float = 0.5,
+    store=None,
+    timer: StageTimer = None,
+) -> Dict:
+    timer = timer or StageTimer()
+    # All assets are needed as targets, but we only hold on to their id and name.
+    # `client.assets` and `client.time_series` are generators when called, fetching one page per iteration.
+    assets_simplified = [asset for page in iter_simplified(client.assets(chunk_size=chunk_size), timer) for asset in page]
+    time_series_pages = iter_simplified(prefetch(client.time_series(chunk_size=chunk_size), depth=prefetch_pages), timer)
+
+    writer = TimeSeriesUpdateWriter(client, max_in_flight=max_in_flight_updates)
+    counts = {"matches": 0, "time_series": 0}
+    time_series_pages = _counted(time_series_pages, counts, "time_series")
+    if local_matcher:
+        matcher = LexicalMatcher(assets_simplified, fuzzy=local_matcher == LOCAL_ONLY)
+        threshold = good_match_threshold if local_matcher == LOCAL_ONLY else local_match_threshold
+        time_series_pages = _match_pages_locally(
+            time_series_pages, matcher, threshold, min_margin, writer, timer, counts
+        )
+        if local_matcher == LOCAL_ONLY:
+            for _ in time_series_pages:
+                pass
+
+    # The unsupervised model only needs a representative sample of the sources, so we train on the first pages. After
+    # the local matcher these can be small, so pages are taken until there are at least `chunk_size` time series.
+    sample_pages = []
+    for page in time_series_pages:
+        sample_pages.append(page)
+        if sum(len(p) for p in sample_pages) >= chunk_size:
+            break
+    sample = [ts for page in sample_pages for ts in page]
+    if sample:
+        with timer.stage("fit", len(sample) + len(assets_simplified)):
+            model = fit_or_reuse(client, sample, assets_simplified, store)
+            print(f"Waiting for entity matcher model with id {model}, trained on {len(sample)} sampled time series ...")
+            model.wait_for_completion()
+
+        pages = itertools.chain(sample_pages, time_series_pages)
+        num_matches = 2 if min_margin > 0 else 1
+        predictions = predict_concurrently(model, pages, max_in_flight=max_in_flight_predicts, num_matches=num_matches)
+        for items in timer.timed_iter("predict", predictions):
+            with timer.stage("filter", len(items)):
+                time_series_updates = select_updates(items, good_match_threshold, min_margin)
+            counts["matches"] += len(time_series_updates)
+            with timer.stage("update", len(time_series_updates)):
+                writer.write(time_series_updates)
+    with timer.stage("update"):
+        writer.close()
+
+    print(f"Streamed {counts['time_series']} time series in chunks of {chunk_size}")
+    return {"matches": counts["matches"], "updates": writer.counts()}
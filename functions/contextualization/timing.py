@@ -0,0 +1,64 @@
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator
+
+_END = object()
+
+
+def peak_rss_mb() -> float:
+    # The peak resident set size of the process so far. Linux reports it in kilobytes and macOS in bytes.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+class StageTimer:
+    # Collects wall time and item counts per stage of the function. A stage can be entered several times, for instance
+    # once per chunk, and the time is then summed up, so stages that are interleaved in a pipeline are still separated.
+    def __init__(self):
+        self.stages = {}
+
+    def _stage(self, name: str) -> Dict:
+        return self.stages.setdefault(name, {"seconds": 0.0, "items": 0, "peak_rss_mb": 0.0})
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0):
+        stage = self._stage(name)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage["seconds"] += time.perf_counter() - t0
+            stage["items"] += items
+            stage["peak_rss_mb"] = peak_rss_mb()
+
+    def count(self, name: str, items: int):
+        self._stage(name)["items"] += items
+
+    def timed_iter(self, name: str, iterable: Iterable, size=len) -> Iterator:
+        # Time spent waiting for the next element, which is where a generator that downloads or predicts does its work
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                element = next(iterator, _END)
+            if element is _END:
+                return
+            self.count(name, size(element))
+            yield element
+
+    def report(self) -> Dict[str, Dict]:
+        return {
+            name: {
+                "seconds": round(stage["seconds"], 3),
+                "items": stage["items"],
+                "items_per_second": round(stage["items"] / stage["seconds"], 1) if stage["seconds"] > 0 else None,
+                "peak_rss_mb": round(stage["peak_rss_mb"], 1),
+            }
+            for name, stage in self.stages.items()
+        }
+
+    def log(self, **extra):
+        # One JSON line, which is easy to find in the function logs and compare between scheduled runs
+        print(json.dumps({"stage_timings": self.report(), **extra}))
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List
+
+from cognite.client.data_classes import TimeSeriesUpdate
+from cognite.client.exceptions import CogniteAPIError, CogniteNotFoundError
+
+from predict import chunks
+
+# The maximum number of items in one update request to the time series API
+ITEM_LIMIT = 1000
+# Throttling and temporarily unavailable, the request can be sent again after a while
+RETRY_CODES = {429, 502, 503}
+
+
+class TimeSeriesUpdateWriter:
+    # Sends time series updates in batches at the API item limit, with at most `max_in_flight` batches at the same time.
+    # Throttled batches are retried with exponential backoff. Updates for time series that have been deleted since they
+    # were listed are skipped, and batches that still fail are counted as failed without stopping the others.
+    def __init__(
+        self,
+        client,
+        batch_size: int = ITEM_LIMIT,
+        max_in_flight: int = 4,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        track_written: bool = False,
+    ):
+        self.client = client
+        self.batch_size = min(batch_size, ITEM_LIMIT)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.applied = 0
+        self.skipped = 0
+        self.failed = 0
+        self.failed_ids = []
+        # With `track_written`, the lastUpdatedTime our update gave each time series, so an incremental run can tell its
+        # own writes apart from later changes
+        self.track_written = track_written
+        self.written = {}
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._in_flight = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write(self, updates: List[TimeSeriesUpdate]):
+        # Blocks only when `max_in_flight` batches are already being sent, so the caller can keep producing updates
+        for batch in chunks(updates, self.batch_size):
+            if len(self._in_flight) >= self.max_in_flight:
+                _, self._in_flight = wait(self._in_flight, return_when=FIRST_COMPLETED)
+            self._in_flight.add(self._executor.submit(self._write_batch, batch))
+
+    def close(self) -> Dict[str, int]:
+        wait(self._in_flight)
+        self._in_flight = set()
+        self._executor.shutdown()
+        if self.failed_ids:
+            print(f"Failed to update {self.failed} time series, for instance {self.failed_ids[:10]}")
+        return self.counts()
+
+    def counts(self) -> Dict[str, int]:
+        return {"applied": self.applied, "skipped": self.skipped, "failed": self.failed}
+
+    def _write_batch(self, batch: List[TimeSeriesUpdate]):
+        attempt = 0
+        while batch:
+            try:
+                updated = self.client.time_series.update(batch)
+                with self._lock:
+                    self.applied += len(batch)
+                    if self.track_written:
+                        self.written.update((ts.id, ts.last_updated_time) for ts in updated)
+                return
+            except CogniteNotFoundError as e:
+                # Deleted since they were listed, try again without them
+                not_found = {item.get("id") for item in e.not_found}
+                remaining = [update for update in batch if _update_id(update) not in not_found]
+                if len(remaining) == len(batch):
+                    # None of the missing ids are in this batch (e.g. an asset that was not found), so sending it again
+                    # would fail the same way
+                    print(f"Failed to update {len(batch)} time series: {e}")
+                    with self._lock:
+                        self.failed += len(batch)
+                        self.failed_ids.extend(_update_id(update) for update in batch)
+                    return
+                with self._lock:
+                    self.skipped += len(batch) - len(remaining)
+                batch = remaining
+            except Exception as e:
+                if isinstance(e, CogniteAPIError) and e.code in RETRY_CODES and attempt < self.max_retries:
+                    time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+                    attempt += 1
+                    continue
+                print(f"Failed to update {len(batch)} time series: {e}")
+                with self._lock:
+                    self.failed += len(batch)
+                    self.failed_ids.extend(_update_id(update) for update in batch)
+                return
+
+
+def _update_id(update: TimeSeriesUpdate) -> int:
+    return update.dump()["id"]